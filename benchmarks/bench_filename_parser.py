@@ -0,0 +1,128 @@
+"""
+Filename parser benchmark and parity check.
+
+Compares utils.filename_parser, and the title_key that utils.helpers.parse_file_info stores
+on file documents, against the original PTN based clean_filename/get_title_key on
+benchmarks/filename_corpus.txt and reports names per second.
+
+Usage (from the repo root):
+    python benchmarks/bench_filename_parser.py [--rounds N]
+"""
+import argparse
+import logging
+import os
+import re
+import sys
+import time
+
+import PTN
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import filename_parser  # noqa: E402
+from utils.helpers import parse_file_info  # noqa: E402
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "filename_corpus.txt")
+
+
+# --- Reference implementation: clean_filename / get_title_key exactly as they were before the parser engine ---
+def legacy_clean_filename(name):
+    if not name:
+        return "Untitled", "Untitled", None
+    try:
+        processed_name = name.replace('.', ' ').replace('_', ' ')
+        parsed_info = PTN.parse(processed_name)
+        base_title = parsed_info.get('title')
+        year = str(parsed_info.get('year')) if parsed_info.get('year') else None
+        if not base_title:
+            raise ValueError("PTN did not find a title, triggering fallback.")
+        if 'season' in parsed_info and 'episode' in parsed_info:
+            season = parsed_info.get('season')
+            episode = parsed_info.get('episode')
+            full_title = f"{base_title} S{str(season).zfill(2)}E{str(episode).zfill(2)}"
+            episode_name = parsed_info.get('episodeName')
+            if episode_name:
+                full_title = f"{full_title} - {episode_name}"
+            return base_title.strip(), full_title.strip(), year
+        return base_title.strip(), base_title.strip(), year
+    except Exception:
+        fallback_name = re.sub(r'\.[^.]*$', '', name)
+        fallback_name = fallback_name.replace('.', ' ').replace('_', ' ').strip()
+        fallback_name = re.sub(r'\s*\(\d{4}\)\s*', '', fallback_name).strip()
+        fallback_name = re.sub(r'\s*\[.*?\]\s*', '', fallback_name).strip()
+        match = re.split(r'\b(19|20)\d{2}\b|720p|1080p|4k|webrip|web-dl|bluray|hdrip', fallback_name, maxsplit=1, flags=re.I)
+        final_title = match[0].strip()
+        if not final_title:
+            final_title = fallback_name
+        return final_title, final_title, None
+
+
+def legacy_get_title_key(filename):
+    base_title, _, _ = legacy_clean_filename(filename)
+    cleaned_base_title = re.sub(r'@\S+', '', base_title)
+    cleaned_base_title = re.sub(r'Join Us On Telegram', '', cleaned_base_title, flags=re.IGNORECASE)
+    return cleaned_base_title.lower().strip()
+
+
+def load_corpus(path=CORPUS_PATH):
+    with open(path, encoding='utf-8') as f:
+        return [line.rstrip('\n') for line in f if line.strip() and not line.startswith('#')]
+
+
+def check_parity(names):
+    mismatches = []
+    for name in names:
+        for label, old, new in (
+            ("clean_filename", legacy_clean_filename(name), filename_parser.clean_filename(name)),
+            ("title_key", legacy_get_title_key(name), parse_file_info(name)['title_key']),
+            ("parse(raw)", PTN.parse(name), filename_parser.parse(name)),
+        ):
+            if old != new:
+                mismatches.append((label, name, old, new))
+    return mismatches
+
+
+def names_per_second(func, names, rounds, clear=None):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        if clear: clear()
+        for name in names:
+            func(name)
+    return (len(names) * rounds) / (time.perf_counter() - start)
+
+
+def clear_memo():
+    filename_parser.clean_filename.cache_clear()
+    filename_parser._parse_cached.cache_clear()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    names = load_corpus()
+    mismatches = check_parity(names)
+    print(f"Corpus: {len(names)} filenames")
+    if mismatches:
+        for label, name, old, new in mismatches:
+            print(f"MISMATCH [{label}] {name!r}\n  legacy: {old!r}\n  new:    {new!r}")
+        print(f"FAILED: {len(mismatches)} mismatches")
+        return 1
+    print("Parity: OK (clean_filename, title_key and parse match the legacy PTN path)")
+
+    legacy = names_per_second(legacy_clean_filename, names, args.rounds)
+    cold = names_per_second(filename_parser.clean_filename, names, args.rounds, clear=clear_memo)
+    warm = names_per_second(filename_parser.clean_filename, names, args.rounds)
+    file_info = names_per_second(parse_file_info, names, args.rounds, clear=clear_memo)
+    print(f"legacy clean_filename : {legacy:12,.0f} names/s")
+    print(f"parser (cold memo)    : {cold:12,.0f} names/s  ({cold / legacy:.1f}x)")
+    print(f"parser (warm memo)    : {warm:12,.0f} names/s  ({warm / legacy:.1f}x)")
+    # parse_file_info title ke saath saare tags bhi nikalta hai, isliye legacy se seedha ratio nahi
+    print(f"parse_file_info (cold): {file_info:12,.0f} names/s  (title, title_key and tags)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
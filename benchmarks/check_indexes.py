@@ -0,0 +1,43 @@
+"""
+Index check.
+
+Applies database.indexes.INDEXES to the configured database (MONGO_URI / DATABASE_NAME)
+and explain()s every query shape in database.indexes.QUERY_SHAPES. Exits with status 1
+if any db.py helper's query would scan a whole collection.
+
+Usage (from the repo root):
+    python benchmarks/check_indexes.py [--skip-create]
+"""
+import argparse
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.indexes import ensure_indexes, verify_indexes  # noqa: E402
+
+
+async def run(skip_create):
+    if not skip_create:
+        await ensure_indexes()
+    results = await verify_indexes()
+    for helper, stages, uses_index in results:
+        print(f"{'OK  ' if uses_index else 'SCAN'}  {helper:45}  {' > '.join(stages)}")
+    failures = [helper for helper, _, uses_index in results if not uses_index]
+    if failures:
+        print(f"FAILED: {len(failures)} helpers scan a whole collection")
+        return 1
+    print(f"All {len(results)} query shapes use an index.")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--skip-create", action="store_true", help="only explain, do not create missing indexes")
+    args = parser.parse_args()
+    return asyncio.run(run(args.skip_create))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
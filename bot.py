@@ -9,15 +9,26 @@ from pyromod import Client
 from aiohttp import web
 from config import Config
 from database.db import (
-    get_user, save_file_data, get_owner_db_channel, get_stream_channel, get_file_by_unique_id
+    get_user, save_file_data, get_owner_db_channel, get_stream_channel, get_file_by_unique_id,
+    load_db_channel_index, backfill_user_segments
 )
-from utils.helpers import create_post, clean_filename, notify_and_remove_invalid_channel, get_title_key
+from database.search import setup_search
+from database.indexes import ensure_indexes
+from utils.http import start_http_client, close_http_client
+from features.poster import send_poster
+from features.shortener import queue_shortlinks, run_shortlink_worker, run_shortener_probes
+from features.broadcaster import resume_broadcasts
+from utils.helpers import create_post, notify_and_remove_invalid_channel, BatchFile, parse_file_info
+from utils.batch_scheduler import BatchScheduler
+from utils.channel_registry import channel_registry, ACCESS_ERRORS
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", handlers=[logging.FileHandler("bot.log"), logging.StreamHandler()])
 logging.getLogger("pyrogram").setLevel(logging.WARNING)
 logging.getLogger("pyromod").setLevel(logging.WARNING)
 logger = logging.getLogger(__name__)
 
+POST_SEND_DELAY = 2
+
 async def handle_redirect(request):
     file_unique_id = request.match_info.get('file_unique_id', None)
     if not file_unique_id: return web.Response(text="File ID missing.", status=400)
@@ -47,6 +58,7 @@ class Bot(Client):
         self.stream_channel_id = None
         self.file_queue = asyncio.Queue()
         self.open_batches = {}
+        self.batch_scheduler = BatchScheduler(self._finalize_batch)
         
         # ================================================================= #
         # VVVVVV NAYA DOWNLOAD TRACKING SYSTEM VVVVVV #
@@ -78,39 +90,51 @@ class Bot(Client):
         try:
             if user_id not in self.open_batches or batch_key not in self.open_batches[user_id]: return
             batch_data = self.open_batches[user_id].pop(batch_key)
-            messages = batch_data['messages']
-            if not messages: return
+            files = batch_data['files']
+            if not files: return
             
-            first_filename = getattr(messages[0], messages[0].media.value).file_name
-            batch_display_title, _, _ = clean_filename(first_filename)
+            batch_display_title = files[0].base_title
 
             user = await get_user(user_id)
-            post_channels = user.get('post_channels', [])
-            if not user or not post_channels: return
-
-            valid_post_channels = []
-            for channel_id in post_channels:
-                if await notify_and_remove_invalid_channel(self, user_id, channel_id, "Post"):
-                    valid_post_channels.append(channel_id)
+            if not user or not user.get('post_channels'): return
+            post_channels = user['post_channels']
+
+            # Channel checks aur post banana (poster search samet) saath saath chalte hain
+            checks, posts_to_send = await asyncio.gather(
+                asyncio.gather(*(notify_and_remove_invalid_channel(self, user_id, channel_id, "Post") for channel_id in post_channels)),
+                create_post(self, user_id, files)
+            )
+            valid_post_channels = [channel_id for channel_id, is_valid in zip(post_channels, checks) if is_valid]
             
             if not valid_post_channels:
                 logger.warning(f"User {user_id} has no valid post channels for batch '{batch_display_title}'.")
                 return
-
-            posts_to_send = await create_post(self, user_id, messages)
             
-            for channel_id in valid_post_channels:
-                for post in posts_to_send:
-                    poster, caption, footer = post
-                    if poster: await self.send_with_protection(self.send_photo, channel_id, poster, caption=caption, reply_markup=footer)
-                    else: await self.send_with_protection(self.send_message, channel_id, caption, reply_markup=footer, disable_web_page_preview=True)
-                    await asyncio.sleep(2)
+            # Har channel ka apna task hai, to total time sabse slow channel jitna hi lagega
+            await asyncio.gather(*(self._send_posts_to_channel(channel_id, posts_to_send) for channel_id in valid_post_channels))
+            # Click se pehle hi shortlinks bana lo, taaki user ko shortener ka intezaar na karna pade
+            queue_shortlinks(user_id, [record.file_unique_id for record in files])
         except Exception as e: 
             logger.exception(f"Error finalizing batch {batch_key}: {e}")
         finally:
             if user_id in self.open_batches and not self.open_batches[user_id]:
                 del self.open_batches[user_id]
 
+    async def _send_posts_to_channel(self, channel_id, posts, delay=POST_SEND_DELAY):
+        """Sends all parts of a post to one channel, spacing the sends to stay under flood limits."""
+        for i, (poster, caption, footer) in enumerate(posts):
+            try:
+                if poster: await send_poster(self, channel_id, poster, caption, footer)
+                else: await self.send_with_protection(self.send_message, channel_id, caption, reply_markup=footer, disable_web_page_preview=True)
+            except ACCESS_ERRORS as e:
+                logger.error(f"Lost access to channel {channel_id} while posting: {e}")
+                channel_registry.invalidate(channel_id)
+                return
+            except Exception as e:
+                logger.error(f"Failed to send post part {i + 1}/{len(posts)} to channel {channel_id}: {e}")
+            if i < len(posts) - 1:
+                await asyncio.sleep(delay)
+
     async def file_processor_worker(self):
         logger.info("File Processor Worker started.")
         while True:
@@ -138,36 +162,40 @@ class Bot(Client):
                 else:
                     stream_message = copied_message
 
-                await save_file_data(user_id, message, copied_message, stream_message)
+                # Filename sirf ek baar parse hota hai; wahi info DB aur batch dono mein jaati hai
+                file_info = parse_file_info(getattr(copied_message, copied_message.media.value).file_name)
+                await save_file_data(user_id, message, copied_message, stream_message, file_info)
                 
-                filename = getattr(copied_message, copied_message.media.value).file_name
-                title_key = get_title_key(filename)
+                record = BatchFile.from_message(copied_message, file_info)
+                title_key = record.title_key if record else None
                 if not title_key:
-                    logger.warning(f"Could not generate a title key for filename: {filename}")
+                    logger.warning(f"Could not generate a title key for filename: {record.file_name if record else None}")
                     self.file_queue.task_done()
                     continue
 
                 self.open_batches.setdefault(user_id, {})
-                loop = asyncio.get_event_loop()
 
                 if title_key in self.open_batches[user_id]:
-                    batch = self.open_batches[user_id][title_key]
-                    batch['messages'].append(copied_message)
-                    if batch.get('timer'): batch['timer'].cancel()
-                    batch['timer'] = loop.call_later(7, lambda key=title_key: asyncio.create_task(self._finalize_batch(user_id, key)))
+                    self.open_batches[user_id][title_key]['files'].append(record)
                     logger.info(f"Added to batch with key '{title_key}'")
                 else:
-                    self.open_batches[user_id][title_key] = {
-                        'messages': [copied_message],
-                        'timer': loop.call_later(7, lambda key=title_key: asyncio.create_task(self._finalize_batch(user_id, key)))
-                    }
+                    self.open_batches[user_id][title_key] = {'files': [record]}
                     logger.info(f"Created new batch with key '{title_key}'")
+                self.batch_scheduler.touch(user_id, title_key)
                 
                 self.file_queue.task_done()
 
             except Exception as e:
                 logger.exception(f"CRITICAL Error in file_processor_worker: {e}")
 
+    async def _run_db_setup(self):
+        try: await ensure_indexes()
+        except Exception as e: logger.error(f"Index setup failed: {e}")
+        try: await setup_search()
+        except Exception as e: logger.error(f"Search backfill failed: {e}")
+        try: await backfill_user_segments()
+        except Exception as e: logger.error(f"User segment backfill failed: {e}")
+
     async def send_with_protection(self, coro, *args, **kwargs):
         while True:
             try:
@@ -179,6 +207,7 @@ class Bot(Client):
 
     async def start(self):
         await super().start()
+        await start_http_client()
         self.me = await self.get_me()
         self.owner_db_channel_id = await get_owner_db_channel()
         self.stream_channel_id = await get_stream_channel()
@@ -186,16 +215,26 @@ class Bot(Client):
         else: logger.warning("Owner DB ID not set. Use 'Set Owner DB' as admin.")
         if self.stream_channel_id: logger.info(f"Loaded Stream Channel ID [{self.stream_channel_id}]")
         else: logger.info("Stream Channel not set. Will use Owner DB for streaming.")
+        try: await load_db_channel_index()
+        except Exception as e: logger.error(f"Could not load DB channel index, falling back to per-message lookups: {e}")
         try:
             with open(Config.BOT_USERNAME_FILE, 'w') as f: f.write(f"@{self.me.username}")
             logger.info(f"Updated bot username to @{self.me.username}")
         except Exception as e: logger.error(f"Could not write to {Config.BOT_USERNAME_FILE}: {e}")
+        asyncio.create_task(self._run_db_setup())
+        self.batch_scheduler.start()
+        asyncio.create_task(channel_registry.run_refresher(self))
         asyncio.create_task(self.file_processor_worker())
+        asyncio.create_task(run_shortlink_worker(self))
+        asyncio.create_task(run_shortener_probes())
+        asyncio.create_task(resume_broadcasts(self))
         await self.start_web_server()
         logger.info(f"Bot @{self.me.username} started successfully.")
 
     async def stop(self, *args):
         logger.info("Stopping bot...")
+        await self.batch_scheduler.stop()
+        await close_http_client()
         if self.web_runner:
             await self.web_runner.cleanup()
         await super().stop()
@@ -1,7 +1,12 @@
+import copy
 import datetime
 import logging
+import re
+import time
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
 from config import Config
+from utils.cache import TTLCache
 
 client = AsyncIOMotorClient(Config.MONGO_URI)
 db = client[Config.DATABASE_NAME]
@@ -11,44 +16,96 @@ users = db['users']
 files = db['files']
 bot_settings = db['bot_settings']
 verified_users = db['verified_users']
+backup_jobs = db['backup_jobs']
+posters = db['posters']
+shortlinks = db['shortlinks']
+broadcasts = db['broadcasts']
+invite_links = db['invite_links']
+
+# --- In-memory DB channel -> owners index (new_file_handler ke hot path ke liye) ---
+# Ek channel kai owners ka ho sakta hai; list registration order mein hai aur pehla owner file paata hai
+_db_channel_owners = {}
+_unknown_db_channels = {}
+_db_channel_index_loaded = False
+UNKNOWN_CHANNEL_TTL = 10 * 60
+
+# --- Per-user settings cache (get_user har request par kai baar chalta hai) ---
+USER_CACHE_SIZE = 5000
+USER_CACHE_TTL = 5 * 60
+_user_cache = TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+# Har user ka apna write counter: ek user ka write dusre users ke reads ko cache hone se nahi rokta.
+# Entries sirf ek read jitni der kaam ki hain, isliye chhota TTL kaafi hai.
+_user_write_seq = TTLCache(maxsize=USER_CACHE_SIZE * 4, ttl=60)
+
+def _invalidate_user(user_id):
+    _user_write_seq.set(user_id, _user_write_seq.get(user_id, 0) + 1)
+    _user_cache.pop(user_id)
+
+KNOWN_USERS_SIZE = 100000
+_known_users = TTLCache(maxsize=KNOWN_USERS_SIZE, ttl=6 * 60 * 60)  # is process mein dekhe gaye users: upsert dobara nahi
 
 async def add_user(user_id):
-    """Adds a new user to the database if they don't already exist."""
+    """Adds a new user to the database if they don't already exist. Users this process has already seen cost no DB call."""
+    if user_id in _known_users: return
     user_data = {
         'user_id': user_id, 'post_channels': [], 'db_channels': [],
         'shortener_url': None, 'shortener_api': None, 'fsub_channel': None,
         'filename_url': None, 'footer_buttons': [], 'show_poster': True,
         'shortener_enabled': True, 'how_to_download_link': None,
-        'shortener_mode': 'each_time'
+        'shortener_mode': 'each_time', 'file_count': 0, 'is_storage_owner': False
     }
-    await users.update_one({'user_id': user_id}, {"$setOnInsert": user_data}, upsert=True)
+    result = await users.update_one({'user_id': user_id}, {"$setOnInsert": user_data}, upsert=True)
+    _known_users.set(user_id, True)
+    if result.upserted_id is not None:
+        _segment_counts.pop('total_users')
+        _invalidate_user(user_id)
+
+# --- Verification (12 hour shortener mode) ---
+VERIFICATION_WINDOW = datetime.timedelta(hours=12)
+UNVERIFIED_CACHE_TTL = 5 * 60
+_verification_cache = TTLCache(maxsize=20000, ttl=UNVERIFIED_CACHE_TTL)
+
+def _cache_verification(requester_id, owner_id, verified_at):
+    """Caches a verification until its 12 hour window ends, or a miss for a few minutes."""
+    expires_in = (verified_at + VERIFICATION_WINDOW - datetime.datetime.utcnow()).total_seconds() if verified_at else 0
+    if expires_in > 0: _verification_cache.set((requester_id, owner_id), True, ttl=expires_in)
+    else: _verification_cache.set((requester_id, owner_id), False)
 
-# ... (is_user_verified, add_user_verification, claim_verification_for_file functions remain unchanged) ...
 async def is_user_verified(requester_id: int, owner_id: int) -> bool:
+    cached = _verification_cache.get((requester_id, owner_id))
+    if cached is not None: return cached
     try:
-        verification = await verified_users.find_one({'requester_id': requester_id, 'owner_id': owner_id})
-        if not verification or 'verified_at' not in verification or not isinstance(verification['verified_at'], datetime.datetime):
-            return False
-        twelve_hours_ago = datetime.datetime.utcnow() - datetime.timedelta(hours=12)
-        return verification['verified_at'] > twelve_hours_ago
+        verification = await verified_users.find_one({'requester_id': requester_id, 'owner_id': owner_id}, {'verified_at': 1})
+        verified_at = verification.get('verified_at') if verification else None
+        if not isinstance(verified_at, datetime.datetime): verified_at = None
+        _cache_verification(requester_id, owner_id, verified_at)
+        return _verification_cache.get((requester_id, owner_id), False)
     except Exception as e:
         logger.error(f"An error occurred in is_user_verified check: {e}")
         return False
 
 async def add_user_verification(requester_id: int, owner_id: int):
+    verified_at = datetime.datetime.utcnow()
     await verified_users.update_one(
         {'requester_id': requester_id, 'owner_id': owner_id},
-        {"$set": {'verified_at': datetime.datetime.utcnow()}},
+        {"$set": {'verified_at': verified_at}},
         upsert=True
     )
+    _cache_verification(requester_id, owner_id, verified_at)
 
 async def claim_verification_for_file(file_unique_id: str, requester_id: int, owner_id: int) -> bool:
-    unclaimed_file_query = {'file_unique_id': file_unique_id, 'verification_claimed': {'$ne': True}}
-    result = await files.update_one(unclaimed_file_query, {'$set': {'verification_claimed': True}})
-    if result.modified_count > 0:
-        await add_user_verification(requester_id, owner_id)
-        return True
-    return False
+    """
+    Atomically marks the file's verification link as used and, if this call won the
+    claim, verifies the requester for the owner. Returns whether the claim succeeded.
+    """
+    claimed = await files.find_one_and_update(
+        {'file_unique_id': file_unique_id, 'verification_claimed': {'$ne': True}},
+        {'$set': {'verification_claimed': True}},
+        projection={'_id': 1}
+    )
+    if not claimed: return False
+    await add_user_verification(requester_id, owner_id)
+    return True
 
 # --- NEW: Functions for Stream Channel ---
 async def set_stream_channel(channel_id: int):
@@ -70,11 +127,13 @@ async def get_owner_db_channel():
     return config.get('channel_id') if config else None
 
 # --- MODIFIED: save_file_data now includes stream_message ---
-async def save_file_data(owner_id, original_message, copied_message, stream_message):
-    """Saves file metadata, including the new stream_id."""
-    from utils.helpers import get_file_raw_link
+async def save_file_data(owner_id, original_message, copied_message, stream_message, file_info=None):
+    """Saves file metadata, including the new stream_id and the filename info parsed at ingest."""
+    from utils.helpers import get_file_raw_link, parse_file_info
+    from database.search import filename_grams
     original_media = getattr(original_message, original_message.media.value)
     raw_link = await get_file_raw_link(copied_message)
+    file_info = file_info or parse_file_info(original_media.file_name)
     file_data = {
         'owner_id': owner_id,
         'file_unique_id': original_media.file_unique_id,
@@ -82,70 +141,285 @@ async def save_file_data(owner_id, original_message, copied_message, stream_mess
         'stream_id': stream_message.id,  # Save the message ID from the stream channel
         'file_name': original_media.file_name,
         'file_size': original_media.file_size,
-        'raw_link': raw_link
+        'raw_link': raw_link,
+        'title_key': file_info['title_key'],
+        'parsed': file_info,
+        'search_grams': filename_grams(original_media.file_name)
     }
-    await files.update_one(
+    result = await files.update_one(
         {'owner_id': owner_id, 'file_unique_id': original_media.file_unique_id},
         {'$set': file_data}, upsert=True
     )
+    _delivery_cache.pop(original_media.file_unique_id)
+    if result.upserted_id is not None:
+        _file_saves[owner_id] = _file_saves.get(owner_id, 0) + 1
+        # Sirf naye file par count badhao; purane users ka count pehli baar padhne par bharta hai
+        await users.update_one({'user_id': owner_id, 'file_count': {'$exists': True}}, {'$inc': {'file_count': 1}})
 # --- END MODIFIED ---
 
 async def get_user(user_id):
-    return await users.find_one({'user_id': user_id})
+    """
+    Returns the user's settings document, served from the in-process cache when possible.
+    Callers get their own copy, so mutating it never leaks into the cache.
+    """
+    user = _user_cache.get(user_id)
+    if user is None:
+        write_seq = _user_write_seq.get(user_id, 0)
+        user = await users.find_one({'user_id': user_id})
+        # Read ke dauraan koi write hua ho to purana doc cache mat karo
+        if user is None or write_seq != _user_write_seq.get(user_id, 0): return user
+        _user_cache.set(user_id, user)
+    return copy.deepcopy(user)
 
 # ... (Rest of the db.py functions remain unchanged) ...
-async def get_all_user_ids(storage_owners_only=False):
-    query = {}
-    if storage_owners_only:
-        query = {"$or": [{"post_channels": {"$exists": True, "$ne": []}}, {"db_channels": {"$exists": True, "$ne": []}}]}
-    cursor = users.find(query, {'user_id': 1})
-    return [doc['user_id'] for doc in await cursor.to_list(length=None) if 'user_id' in doc]
-async def get_storage_owner_ids():
-    query = {"$or": [{"post_channels": {"$exists": True, "$ne": []}}, {"db_channels": {"$exists": True, "$ne": []}}]}
-    cursor = users.find(query, {'user_id': 1})
-    return [doc['user_id'] for doc in await cursor.to_list(length=None) if 'user_id' in doc]
-async def get_normal_user_ids():
-    all_users_cursor = users.find({}, {'user_id': 1})
-    storage_owners_cursor = users.find({"$or": [{"post_channels": {"$exists": True, "$ne": []}}, {"db_channels": {"$exists": True, "$ne": []}}]}, {'user_id': 1})
-    all_user_ids = {doc['user_id'] for doc in await all_users_cursor.to_list(length=None) if 'user_id' in doc}
-    storage_owner_ids = {doc['user_id'] for doc in await storage_owners_cursor.to_list(length=None) if 'user_id' in doc}
-    return list(all_user_ids - storage_owner_ids)
+# --- User segments: is_storage_owner flag add_to_list/remove_from_list ke saath update hota hai ---
+STORAGE_OWNER_QUERY = {"$or": [{"post_channels": {"$exists": True, "$ne": []}}, {"db_channels": {"$exists": True, "$ne": []}}]}
+CHANNEL_LISTS = ('post_channels', 'db_channels')
+SEGMENT_COUNT_TTL = 60
+_HAS_CHANNELS_EXPR = {'$or': [{'$gt': [{'$size': {'$ifNull': [f'${name}', []]}}, 0]} for name in CHANNEL_LISTS]}
+_segment_counts = TTLCache(maxsize=8, ttl=SEGMENT_COUNT_TTL)
 async def get_storage_owners_count():
-    query = {"$or": [{"post_channels": {"$exists": True, "$ne": []}}, {"db_channels": {"$exists": True, "$ne": []}}]}
-    return await users.count_documents(query)
+    count = _segment_counts.get('storage_owners')
+    if count is None:
+        count = await users.count_documents({'is_storage_owner': True})
+        _segment_counts.set('storage_owners', count)
+    return count
+async def backfill_user_segments():
+    """Sets is_storage_owner on users saved before the flag existed. Only touches documents without it."""
+    owners = await users.update_many({'is_storage_owner': {'$exists': False}, **STORAGE_OWNER_QUERY}, {'$set': {'is_storage_owner': True}})
+    others = await users.update_many({'is_storage_owner': {'$exists': False}}, {'$set': {'is_storage_owner': False}})
+    if owners.modified_count or others.modified_count:
+        _segment_counts.clear()
+        logger.info(f"Backfilled user segments: {owners.modified_count} storage owners, {others.modified_count} other users.")
 async def update_user(user_id, key, value):
     await users.update_one({'user_id': user_id}, {'$set': {key: value}}, upsert=True)
+    cached = _user_cache.get(user_id)
+    _invalidate_user(user_id)
+    if key == 'filename_url': _drop_owner_delivery_records(user_id)
+    if cached is not None and '.' not in key:
+        cached[key] = copy.deepcopy(value)
+        _user_cache.set(user_id, cached)
 async def add_to_list(user_id, list_name, item):
-    await users.update_one({'user_id': user_id}, {'$addToSet': {list_name: item}})
+    update = {'$addToSet': {list_name: item}}
+    if list_name in CHANNEL_LISTS:
+        update['$set'] = {'is_storage_owner': True}
+        _segment_counts.clear()
+    await users.update_one({'user_id': user_id}, update)
+    _invalidate_user(user_id)
+    if list_name == 'db_channels':
+        owners = _db_channel_owners.setdefault(item, [])
+        if user_id not in owners: owners.append(user_id)
+        _unknown_db_channels.pop(item, None)
 async def remove_from_list(user_id, list_name, item):
-    await users.update_one({'user_id': user_id}, {'$pull': {list_name: item}})
+    if list_name in CHANNEL_LISTS:
+        # Pull aur flag ka naya hisaab ek hi atomic pipeline update mein
+        await users.update_one({'user_id': user_id}, [
+            {'$set': {list_name: {'$filter': {'input': {'$ifNull': [f'${list_name}', []]}, 'cond': {'$ne': ['$$this', item]}}}}},
+            {'$set': {'is_storage_owner': _HAS_CHANNELS_EXPR}}
+        ])
+        _segment_counts.clear()
+    else:
+        await users.update_one({'user_id': user_id}, {'$pull': {list_name: item}})
+    _invalidate_user(user_id)
+    if list_name == 'db_channels' and user_id in _db_channel_owners.get(item, []):
+        _db_channel_owners[item].remove(user_id)
+        if not _db_channel_owners[item]: del _db_channel_owners[item]
+async def load_db_channel_index():
+    """Loads the DB channel -> owners map once at startup."""
+    global _db_channel_index_loaded
+    cursor = users.find({'db_channels': {'$exists': True, '$ne': []}}, {'user_id': 1, 'db_channels': 1}).sort('_id', 1)
+    async for doc in cursor:
+        for channel_id in doc.get('db_channels', []):
+            owners = _db_channel_owners.setdefault(channel_id, [])
+            if doc['user_id'] not in owners: owners.append(doc['user_id'])
+    _unknown_db_channels.clear()
+    _db_channel_index_loaded = True
+    logger.info(f"Loaded {len(_db_channel_owners)} DB channels into the owner index.")
 async def find_owner_by_db_channel(channel_id):
-    user = await users.find_one({'db_channels': channel_id})
-    return user['user_id'] if user else None
+    owners = _db_channel_owners.get(channel_id)
+    if owners: return owners[0]
+    if _db_channel_index_loaded: return None
+    # Index load nahi hua to DB se poochho, aur anjaan channels ko kuch der yaad rakho
+    if _unknown_db_channels.get(channel_id, 0) > time.monotonic():
+        return None
+    user = await users.find_one({'db_channels': channel_id}, {'user_id': 1})
+    if not user:
+        _unknown_db_channels[channel_id] = time.monotonic() + UNKNOWN_CHANNEL_TTL
+        return None
+    _db_channel_owners.setdefault(channel_id, []).append(user['user_id'])
+    return user['user_id']
 async def get_file_by_unique_id(file_unique_id: str):
     return await files.find_one({'file_unique_id': file_unique_id})
+
+# --- Delivery records: deep link se file bhejne ke liye sirf zaroori fields ---
+DELIVERY_CACHE_SIZE = 10000
+DELIVERY_CACHE_TTL = 30 * 60
+_delivery_cache = TTLCache(maxsize=DELIVERY_CACHE_SIZE, ttl=DELIVERY_CACHE_TTL)
+_PROMO_MENTION_RE = re.compile(r'@\S+')
+
+def _delivery_pipeline(file_unique_id):
+    return [
+        {'$match': {'file_unique_id': file_unique_id}},
+        {'$limit': 1},
+        {'$project': {'_id': 0, 'owner_id': 1, 'file_id': 1, 'stream_id': 1, 'file_name': 1, 'raw_link': 1}},
+        {'$lookup': {'from': users.name, 'localField': 'owner_id', 'foreignField': 'user_id', 'as': 'owner'}},
+        {'$set': {'filename_url': {'$arrayElemAt': ['$owner.filename_url', 0]}}},
+        {'$unset': 'owner'}
+    ]
+
+async def get_delivery_record(file_unique_id: str):
+    """
+    Everything send_file needs for a file, from one aggregation joined with the owner's
+    settings: owner_id, storage_chat_id (None if unknown), file_id, stream_id, clean_name
+    and filename_url. Records stay cached while the file keeps being requested.
+    Returns None if the file does not exist.
+    """
+    record = _delivery_cache.get(file_unique_id)
+    if record is None:
+        docs = await files.aggregate(_delivery_pipeline(file_unique_id)).to_list(length=1)
+        if not docs: return None
+        doc = docs[0]
+        raw_link = doc.get('raw_link')
+        record = {
+            'owner_id': doc['owner_id'],
+            'storage_chat_id': int("-100" + raw_link.split('/')[-2]) if raw_link else None,
+            'file_id': doc['file_id'],
+            'stream_id': doc.get('stream_id'),
+            'clean_name': _PROMO_MENTION_RE.sub('', doc.get('file_name') or 'N/A').strip(),
+            'filename_url': doc.get('filename_url')
+        }
+    # Har hit par expiry aage badhao taaki popular files cache mein hi rahein
+    _delivery_cache.set(file_unique_id, record)
+    return record
+
+async def get_cached_poster(key):
+    """Returns the unexpired poster cache entry for `key` ({'url': str or None, 'expires_at'}), or None."""
+    return await posters.find_one({'_id': key, 'expires_at': {'$gt': datetime.datetime.utcnow()}})
+async def save_cached_poster(key, url, expires_at):
+    await posters.update_one({'_id': key}, {'$set': {'url': url, 'expires_at': expires_at}}, upsert=True)
+async def set_poster_file_id(key, file_id):
+    """Stores (or with None, clears) the Telegram photo file_id of an uploaded poster."""
+    update = {'$set': {'file_id': file_id}} if file_id else {'$unset': {'file_id': ''}}
+    await posters.update_one({'_id': key}, update)
+
+async def get_cached_shortlink(key):
+    doc = await shortlinks.find_one({'_id': key}, {'short_url': 1})
+    return doc['short_url'] if doc else None
+async def save_cached_shortlink(key, owner_id, domain, target, short_url):
+    await shortlinks.update_one(
+        {'_id': key},
+        {'$set': {'owner_id': owner_id, 'domain': domain, 'target': target, 'short_url': short_url, 'created_at': datetime.datetime.utcnow()}},
+        upsert=True
+    )
+async def get_fsub_invite_link(channel_id):
+    doc = await invite_links.find_one({'_id': channel_id}, {'link': 1})
+    return doc['link'] if doc else None
+async def save_fsub_invite_link(channel_id, link):
+    await invite_links.update_one({'_id': channel_id}, {'$set': {'link': link, 'created_at': datetime.datetime.utcnow()}}, upsert=True)
+async def delete_fsub_invite_link(channel_id):
+    await invite_links.delete_one({'_id': channel_id})
+
+def _drop_owner_delivery_records(owner_id):
+    _delivery_cache.drop_where(lambda record: record['owner_id'] == owner_id)
+async def save_parsed_file_infos(updates):
+    """Backfills parsed filename info on legacy file documents. `updates` is a list of (doc_id, file_info)."""
+    if not updates: return
+    await files.bulk_write([
+        UpdateOne({'_id': doc_id}, {'$set': {'title_key': info['title_key'], 'parsed': info}}) for doc_id, info in updates
+    ], ordered=False)
+_file_saves = {}  # owner_id -> new files saved by this process, taaki counter bharte waqt race pakdi ja sake
 async def get_user_file_count(owner_id):
-    return await files.count_documents({'owner_id': owner_id})
-async def get_all_user_files(user_id):
-    return files.find({'owner_id': user_id})
-async def get_paginated_files(user_id, page: int, page_size: int = 5):
-    skip = (page - 1) * page_size
-    cursor = files.find({'owner_id': user_id}).sort('_id', -1).skip(skip).limit(page_size)
-    return await cursor.to_list(length=page_size)
-async def search_user_files(user_id, query: str, page: int, page_size: int = 5):
-    search_filter = {'owner_id': user_id, 'file_name': {'$regex': query, '$options': 'i'}}
-    skip = (page - 1) * page_size
-    total_files = await files.count_documents(search_filter)
-    cursor = files.find(search_filter).sort('_id', -1).skip(skip).limit(page_size)
-    files_list = await cursor.to_list(length=page_size)
-    return files_list, total_files
+    """Reads the owner's maintained file counter, counting once for users saved before it existed."""
+    user = await users.find_one({'user_id': owner_id}, {'file_count': 1})
+    if user and 'file_count' in user: return user['file_count']
+    saves_before = _file_saves.get(owner_id, 0)
+    count = await files.count_documents({'owner_id': owner_id})
+    if not user: return count
+    await users.update_one({'user_id': owner_id, 'file_count': {'$exists': False}}, {'$set': {'file_count': count}})
+    if _file_saves.get(owner_id, 0) != saves_before:
+        # Ginti ke beech naya file aaya, uska $inc shayad chhoot gaya: counter hatao, agli baar phir ginenge
+        await users.update_one({'user_id': owner_id}, {'$unset': {'file_count': ''}})
+    return count
+BACKUP_FILE_PROJECTION = {'file_unique_id': 1, 'file_name': 1, 'file_size': 1, 'raw_link': 1, 'parsed': 1}
+BACKUP_SCAN_PROJECTION = {'file_name': 1, 'parsed.title': 1}
+BACKUP_CHECKPOINT_TTL = datetime.timedelta(days=3)
+async def get_last_file_id(owner_id):
+    doc = await files.find_one({'owner_id': owner_id}, {'_id': 1}, sort=[('_id', -1)])
+    return doc['_id'] if doc else None
+def iter_backup_files(owner_id, max_id, min_id=None):
+    """Streams the _id, file_name and parsed title of an owner's files in (min_id, max_id], in insertion order."""
+    id_range = {'$lte': max_id}
+    if min_id is not None: id_range['$gt'] = min_id
+    return files.find({'owner_id': owner_id, '_id': id_range}, BACKUP_SCAN_PROJECTION).sort('_id', 1).batch_size(1000)
+async def get_backup_files(file_ids):
+    """Fetches the fields a backup post needs for the given file _ids."""
+    return await files.find({'_id': {'$in': file_ids}}, BACKUP_FILE_PROJECTION).to_list(length=None)
+async def get_backup_checkpoint(owner_id, channel_id):
+    # Purana checkpoint (BACKUP_CHECKPOINT_TTL se zyada) resume nahi hota
+    since = datetime.datetime.utcnow() - BACKUP_CHECKPOINT_TTL
+    return await backup_jobs.find_one({'_id': f"{owner_id}:{channel_id}", 'updated_at': {'$gt': since}})
+async def save_backup_checkpoint(owner_id, channel_id, **fields):
+    fields.update({'owner_id': owner_id, 'channel_id': channel_id, 'updated_at': datetime.datetime.utcnow()})
+    await backup_jobs.update_one({'_id': f"{owner_id}:{channel_id}"}, {'$set': fields}, upsert=True)
+async def delete_backup_checkpoint(owner_id, channel_id):
+    await backup_jobs.delete_one({'_id': f"{owner_id}:{channel_id}"})
+FILE_LIST_PROJECTION = {'file_name': 1, 'file_unique_id': 1}
+async def get_paginated_files(user_id, cursor=None, backwards=False, page_size: int = 5):
+    """
+    Keyset pagination over an owner's files, newest first. `cursor` is the _id of the last
+    file on the current page (or the first one when `backwards`). Returns (files, has_more),
+    where has_more says whether another page exists in the direction travelled.
+    """
+    query = {'owner_id': user_id}
+    if cursor is not None: query['_id'] = {'$gt' if backwards else '$lt': cursor}
+    docs = await files.find(query, FILE_LIST_PROJECTION).sort('_id', 1 if backwards else -1).limit(page_size + 1).to_list(length=page_size + 1)
+    has_more = len(docs) > page_size
+    docs = docs[:page_size]
+    if backwards: docs.reverse()
+    return docs, has_more
+# --- Broadcast jobs ---
+BROADCAST_AUDIENCES = {
+    'all': {'user_id': {'$exists': True}},
+    'storage': {'is_storage_owner': True},
+    'normal': {'is_storage_owner': {'$ne': True}},
+}
+async def create_broadcast(source_chat_id, message_id, audience, status_chat_id, status_message_id):
+    """Creates a broadcast job document (with the audience size) and returns it."""
+    now = datetime.datetime.utcnow()
+    job = {
+        'source_chat_id': source_chat_id, 'message_id': message_id, 'audience': audience,
+        'status_chat_id': status_chat_id, 'status_message_id': status_message_id,
+        'status': 'running', 'position': None, 'sent': 0, 'blocked': 0, 'failed': 0,
+        'total': await users.count_documents(BROADCAST_AUDIENCES[audience]),
+        'created_at': now, 'updated_at': now
+    }
+    job['_id'] = (await broadcasts.insert_one(job)).inserted_id
+    return job
+def iter_broadcast_recipients(audience, after_id=None):
+    """Streams the audience's user_ids in _id order, starting after `after_id`."""
+    query = dict(BROADCAST_AUDIENCES[audience])
+    if after_id is not None: query['_id'] = {'$gt': after_id}
+    return users.find(query, {'user_id': 1}).sort('_id', 1).batch_size(500)
+async def update_broadcast(job_id, **fields):
+    fields['updated_at'] = datetime.datetime.utcnow()
+    await broadcasts.update_one({'_id': job_id}, {'$set': fields})
+async def get_running_broadcasts():
+    return await broadcasts.find({'status': 'running'}).to_list(length=None)
 async def total_users_count():
-    return await users.count_documents({})
+    count = _segment_counts.get('total_users')
+    if count is None:
+        count = await users.estimated_document_count()
+        _segment_counts.set('total_users', count)
+    return count
 async def add_footer_button(user_id, button_name, button_url):
     button = {'name': button_name, 'url': button_url}
     await users.update_one({'user_id': user_id}, {'$push': {'footer_buttons': button}})
+    _invalidate_user(user_id)
 async def remove_footer_button(user_id, button_name):
     await users.update_one({'user_id': user_id}, {'$pull': {'footer_buttons': {'name': button_name}}})
+    _invalidate_user(user_id)
 async def delete_all_files():
     result = await files.delete_many({})
+    _delivery_cache.clear()
+    await users.update_many({'file_count': {'$exists': True}}, {'$set': {'file_count': 0}})
     return result.deleted_count
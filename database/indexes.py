@@ -0,0 +1,111 @@
+import logging
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+from database.db import db, VERIFICATION_WINDOW, BACKUP_CHECKPOINT_TTL
+
+logger = logging.getLogger(__name__)
+
+VERIFICATION_TTL = int(VERIFICATION_WINDOW.total_seconds())
+SHORTLINK_TTL = 30 * 24 * 60 * 60
+INVITE_LINK_TTL = 7 * 24 * 60 * 60
+
+# Har collection ke indexes yahin declare hote hain; ensure_indexes() inhe startup par apply karta hai
+INDEXES = {
+    'users': [
+        IndexModel([('user_id', ASCENDING)]),
+        IndexModel([('db_channels', ASCENDING)]),
+        # Broadcast segments aur /stats count isi flag se padhte hain
+        IndexModel([('is_storage_owner', ASCENDING), ('_id', ASCENDING)]),
+    ],
+    'files': [
+        IndexModel([('file_unique_id', ASCENDING)]),
+        IndexModel([('owner_id', ASCENDING), ('file_unique_id', ASCENDING)]),
+        IndexModel([('owner_id', ASCENDING), ('_id', DESCENDING)]),
+        IndexModel([('owner_id', ASCENDING), ('search_grams', ASCENDING)]),
+    ],
+    'verified_users': [
+        IndexModel([('requester_id', ASCENDING), ('owner_id', ASCENDING)]),
+        # Verification 12 ghante chalti hai, uske baad Mongo khud record hata deta hai
+        IndexModel([('verified_at', ASCENDING)], expireAfterSeconds=VERIFICATION_TTL),
+    ],
+    'posters': [
+        # Har entry apna expires_at khud rakhti hai (hit lamba, miss chhota)
+        IndexModel([('expires_at', ASCENDING)], expireAfterSeconds=0),
+    ],
+    'shortlinks': [
+        IndexModel([('created_at', ASCENDING)], expireAfterSeconds=SHORTLINK_TTL),
+    ],
+    'backup_jobs': [
+        # Ruka hua backup kuch din baad bhool jao, taaki agla backup naye sire se shuru ho
+        IndexModel([('updated_at', ASCENDING)], expireAfterSeconds=int(BACKUP_CHECKPOINT_TTL.total_seconds())),
+    ],
+    'invite_links': [
+        # Owner ne link revoke kar diya ho to bhi hafte bhar mein naya ban jata hai
+        IndexModel([('created_at', ASCENDING)], expireAfterSeconds=INVITE_LINK_TTL),
+    ],
+}
+
+# One representative query per db.py helper, as (helper, collection, filter, sort).
+# Helpers that read a whole collection on purpose (total_users_count, the 'all' broadcast,
+# delete_all_files, the one-time backfills) are not listed.
+_SAMPLE_ID = ObjectId()
+QUERY_SHAPES = [
+    ('get_user / update_user / add_to_list', 'users', {'user_id': 0}, None),
+    ('find_owner_by_db_channel', 'users', {'db_channels': 0}, None),
+    ('get_storage_owners_count', 'users', {'is_storage_owner': True}, None),
+    ('iter_broadcast_recipients (storage)', 'users', {'is_storage_owner': True, '_id': {'$gt': _SAMPLE_ID}}, [('_id', ASCENDING)]),
+    ('is_user_verified / add_user_verification', 'verified_users', {'requester_id': 0, 'owner_id': 0}, None),
+    ('get_file_by_unique_id', 'files', {'file_unique_id': ''}, None),
+    ('claim_verification_for_file', 'files', {'file_unique_id': '', 'verification_claimed': {'$ne': True}}, None),
+    ('save_file_data', 'files', {'owner_id': 0, 'file_unique_id': ''}, None),
+    ('get_user_file_count', 'files', {'owner_id': 0}, None),
+    ('get_last_file_id', 'files', {'owner_id': 0}, [('_id', DESCENDING)]),
+    ('iter_backup_files', 'files', {'owner_id': 0, '_id': {'$gt': _SAMPLE_ID, '$lte': _SAMPLE_ID}}, [('_id', ASCENDING)]),
+    ('get_backup_files', 'files', {'_id': {'$in': [_SAMPLE_ID]}}, None),
+    ('get_paginated_files', 'files', {'owner_id': 0, '_id': {'$lt': _SAMPLE_ID}}, [('_id', DESCENDING)]),
+    ('get_cached_shortlink', 'shortlinks', {'_id': ''}, None),
+    ('get_fsub_invite_link', 'invite_links', {'_id': 0}, None),
+    ('get_cached_poster', 'posters', {'_id': '', 'expires_at': {'$gt': 0}}, None),
+    ('search_user_files', 'files', {'owner_id': 0, 'search_grams': {'$in': [' ab', 'abc']}}, None),
+]
+
+
+async def ensure_indexes():
+    """Creates every index in INDEXES. Safe to run on every start: existing indexes are left as they are."""
+    created = 0
+    for collection_name, models in INDEXES.items():
+        for model in models:
+            try:
+                await db[collection_name].create_indexes([model])
+                created += 1
+            except OperationFailure as e:
+                logger.warning(f"Could not create index '{model.document['name']}' on {collection_name}: {e}")
+    logger.info(f"Index check done: {created} indexes in place.")
+
+
+def _plan_stages(plan):
+    """All stage names in an explain() plan tree, whatever the server version's plan layout."""
+    if isinstance(plan, dict):
+        stages = [plan['stage']] if 'stage' in plan else []
+        for value in plan.values():
+            stages += _plan_stages(value)
+        return stages
+    if isinstance(plan, list):
+        return [stage for item in plan for stage in _plan_stages(item)]
+    return []
+
+
+async def verify_indexes():
+    """
+    Runs explain() on every entry of QUERY_SHAPES.
+    Returns a list of (helper, stages, uses_index) tuples; uses_index is False for any collection scan.
+    """
+    results = []
+    for helper, collection_name, query, sort in QUERY_SHAPES:
+        cursor = db[collection_name].find(query)
+        if sort: cursor = cursor.sort(sort)
+        plan = await cursor.explain()
+        stages = _plan_stages(plan.get('queryPlanner', {}).get('winningPlan', {}))
+        results.append((helper, stages, 'COLLSCAN' not in stages))
+    return results
@@ -0,0 +1,114 @@
+import asyncio
+import logging
+import math
+import re
+from pymongo import UpdateOne
+from database.db import files
+from utils.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+MIN_GRAM_MATCH = 0.6
+BACKFILL_CHUNK = 500
+GRAM_COUNT_CAP = 1000
+GRAM_COUNT_TTL = 10 * 60
+_gram_counts = TTLCache(maxsize=50000, ttl=GRAM_COUNT_TTL)  # (owner_id, gram) -> files having it (capped)
+_NON_ALNUM_RE = re.compile(r'[\W_]+')
+
+
+def normalize_search_text(text: str) -> str:
+    return _NON_ALNUM_RE.sub(' ', (text or '').lower()).strip()
+
+
+def filename_grams(text: str) -> list:
+    """
+    Distinct word trigrams of the normalized text. Words are padded with a space on
+    both sides, so short words and word boundaries still produce grams.
+    """
+    grams = set()
+    for word in normalize_search_text(text).split():
+        padded = f" {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return sorted(grams)
+
+
+async def _gram_count(owner_id, gram):
+    key = (owner_id, gram)
+    count = _gram_counts.get(key)
+    if count is None:
+        count = await files.count_documents({'owner_id': owner_id, 'search_grams': gram}, limit=GRAM_COUNT_CAP)
+        _gram_counts.set(key, count)
+    return count
+
+
+async def _prefilter_grams(owner_id, query_grams, min_hits):
+    """
+    The rarest n - min_hits + 1 of the n query grams. A file sharing at least min_hits
+    grams must contain one of them, so matching on these finds exactly the same files
+    while common grams ("720", "mkv", "the") no longer pull in the whole library.
+    """
+    counts = await asyncio.gather(*(_gram_count(owner_id, gram) for gram in query_grams))
+    ranked = [gram for _, gram in sorted(zip(counts, query_grams))]
+    return ranked[:len(query_grams) - min_hits + 1]
+
+
+def _search_pipeline(owner_id, query_grams, match_grams, min_hits, cursor, backwards, limit, with_total):
+    pipeline = [
+        {'$match': {'owner_id': owner_id, 'search_grams': {'$in': match_grams}}},
+        {'$project': {
+            'file_name': 1, 'file_unique_id': 1,
+            'score': {'$size': {'$setIntersection': ['$search_grams', query_grams]}}
+        }},
+        {'$match': {'score': {'$gte': min_hits}}},
+    ]
+    page = []
+    if cursor is not None:
+        score, last_id = cursor
+        op = '$gt' if backwards else '$lt'
+        page.append({'$match': {'$or': [{'score': {op: score}}, {'score': score, '_id': {op: last_id}}]}})
+    order = 1 if backwards else -1
+    page += [{'$sort': {'score': order, '_id': order}}, {'$limit': limit}]
+    if with_total:
+        pipeline.append({'$facet': {'results': page, 'total': [{'$count': 'count'}]}})
+    else:
+        pipeline += page
+    return pipeline
+
+
+async def search_user_files(user_id, query: str, cursor=None, backwards=False, page_size: int = 5, with_total=False):
+    """
+    Ranked, typo-tolerant filename search over the (owner_id, search_grams) index.
+    A file matches when it shares at least 60% of the query's trigrams; results are
+    ordered by shared trigrams, newest first.
+
+    Paginates by keyset: `cursor` is the (score, _id) of the last result on the current
+    page (or the first one when `backwards`). Returns (files_list, has_more, total);
+    total is only counted when `with_total` is set, otherwise it is None.
+    """
+    query_grams = filename_grams(query)
+    if not query_grams: return [], False, 0
+    min_hits = max(1, math.ceil(len(query_grams) * MIN_GRAM_MATCH))
+    match_grams = await _prefilter_grams(user_id, query_grams, min_hits)
+    pipeline = _search_pipeline(user_id, query_grams, match_grams, min_hits, cursor, backwards, page_size + 1, with_total)
+    if with_total:
+        result = await files.aggregate(pipeline, allowDiskUse=True).to_list(length=1)
+        docs = result[0]['results'] if result else []
+        total = result[0]['total'][0]['count'] if result and result[0]['total'] else 0
+    else:
+        docs, total = await files.aggregate(pipeline, allowDiskUse=True).to_list(length=page_size + 1), None
+    has_more = len(docs) > page_size
+    docs = docs[:page_size]
+    if backwards: docs.reverse()
+    return docs, has_more, total
+
+
+async def setup_search():
+    """Adds search_grams to file documents saved before search existed. Indexes come from database.indexes."""
+    updated, batch = 0, []
+    async for doc in files.find({'search_grams': {'$exists': False}}, {'file_name': 1}):
+        batch.append(UpdateOne({'_id': doc['_id']}, {'$set': {'search_grams': filename_grams(doc.get('file_name'))}}))
+        if len(batch) >= BACKFILL_CHUNK:
+            await files.bulk_write(batch, ordered=False); updated += len(batch); batch = []
+    if batch:
+        await files.bulk_write(batch, ordered=False); updated += len(batch)
+    if updated: logger.info(f"Backfilled search grams on {updated} file documents.")
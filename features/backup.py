@@ -0,0 +1,175 @@
+import asyncio
+import logging
+import time
+from database.db import (
+    iter_backup_files, get_backup_files, get_last_file_id, save_parsed_file_infos,
+    get_backup_checkpoint, save_backup_checkpoint, delete_backup_checkpoint
+)
+from features.poster import send_poster
+from utils.clustering import group_titles_async
+from utils.helpers import BatchFile, create_post, get_doc_file_info
+
+logger = logging.getLogger(__name__)
+
+PREFETCH_CHUNK = 200
+RENDER_AHEAD = 3
+SEND_DELAY = 3
+BACKFILL_CHUNK = 500
+PROGRESS_INTERVAL = 5
+
+
+def _message_ref(doc):
+    """(chat_id, message_id) of the stored copy, taken from the file's raw t.me/c link."""
+    *_, chat_part, message_part = doc['raw_link'].split('/')
+    return int("-100" + chat_part), int(message_part)
+
+
+async def load_backup_titles(owner_id, min_id, max_id):
+    """
+    Streams the owner's files in (min_id, max_id] and returns (_id, title) pairs for clustering.
+    Legacy docs without parsed info are backfilled in bulk on the way.
+    """
+    entries, backfill = [], []
+    async for doc in iter_backup_files(owner_id, max_id, min_id):
+        if not doc.get('file_name'): continue
+        parsed = doc.get('parsed')
+        if not parsed:
+            parsed = get_doc_file_info(doc)
+            backfill.append((doc['_id'], parsed))
+            if len(backfill) >= BACKFILL_CHUNK:
+                await save_parsed_file_infos(backfill)
+                backfill = []
+        if parsed.get('title'): entries.append((doc['_id'], parsed['title']))
+    await save_parsed_file_infos(backfill)
+    return entries
+
+
+async def _fetch_existing(client, docs):
+    """Returns the (chat_id, message_id) refs that still hold media, using one get_messages call per 200 IDs."""
+    ids_by_chat = {}
+    for doc in docs:
+        chat_id, message_id = _message_ref(doc)
+        ids_by_chat.setdefault(chat_id, set()).add(message_id)
+    existing = set()
+    for chat_id, message_ids in ids_by_chat.items():
+        message_ids = sorted(message_ids)
+        for i in range(0, len(message_ids), PREFETCH_CHUNK):
+            messages = await client.get_messages(chat_id, message_ids[i:i + PREFETCH_CHUNK])
+            existing.update((chat_id, m.id) for m in messages if m and m.media)
+    return existing
+
+
+async def _prefetch_batches(client, batches, start):
+    """
+    Yields (index, docs) from `start`. `batches` hold file _ids; their docs are fetched one
+    window of about PREFETCH_CHUNK files at a time, dropping files whose stored message was deleted.
+    """
+    window, window_size = [], 0
+    for index in range(start, len(batches)):
+        window.append(index)
+        window_size += len(batches[index])
+        if window_size < PREFETCH_CHUNK and index < len(batches) - 1:
+            continue
+        docs = {doc['_id']: doc for doc in await get_backup_files([file_id for i in window for file_id in batches[i]])}
+        existing = await _fetch_existing(client, docs.values())
+        for i in window:
+            yield i, [docs[file_id] for file_id in batches[i] if file_id in docs and _message_ref(docs[file_id]) in existing]
+        window, window_size = [], 0
+
+
+async def run_backup(client, owner_id, channel_id, on_status, is_cancelled, fresh=False):
+    """
+    Re-posts all of an owner's files to `channel_id`, grouped into posts.
+
+    Files are streamed from Mongo, messages are checked 200 IDs at a time, the next
+    posts are rendered while the current ones are being sent, and the last sent
+    (batch, part) is checkpointed so a stopped backup resumes without duplicates.
+    A checkpoint older than BACKUP_CHECKPOINT_TTL is ignored and `fresh=True` discards it.
+    Files saved after the resumed window are backed up in a follow-up window.
+    `on_status(text, cancellable)` is awaited for status updates.
+    Returns 'completed', 'cancelled' or 'empty'.
+    """
+    if fresh: await delete_backup_checkpoint(owner_id, channel_id)
+    checkpoint = await get_backup_checkpoint(owner_id, channel_id)
+    if checkpoint:
+        min_id, max_id = checkpoint.get('min_file_id'), checkpoint['max_file_id']
+        start_batch, start_part = checkpoint.get('next_batch', 0), checkpoint.get('next_part', 0)
+    else:
+        min_id, max_id, start_batch, start_part = None, await get_last_file_id(owner_id), 0, 0
+        if max_id is None: return 'empty'
+
+    posted = False
+    while True:
+        await save_backup_checkpoint(owner_id, channel_id, min_file_id=min_id, max_file_id=max_id, next_batch=start_batch, next_part=start_part)
+        result = await _backup_window(client, owner_id, channel_id, min_id, max_id, start_batch, start_part, on_status, is_cancelled)
+        if result == 'cancelled': return result
+        posted = posted or result == 'completed'
+        # Is window ke dauraan (ya pichhle adhoore backup ke baad) aaye naye files agle window mein
+        last_id = await get_last_file_id(owner_id)
+        if last_id is None or last_id <= max_id: break
+        min_id, max_id, start_batch, start_part = max_id, last_id, 0, 0
+
+    await delete_backup_checkpoint(owner_id, channel_id)
+    return 'completed' if posted else 'empty'
+
+
+async def _backup_window(client, owner_id, channel_id, min_id, max_id, start_batch, start_part, on_status, is_cancelled):
+    """Backs up the owner's files in (min_id, max_id], starting at (start_batch, start_part)."""
+    await on_status("⏳ `Step 1/3:` Fetching all your file records...", False)
+    entries = await load_backup_titles(owner_id, min_id, max_id)
+    if not entries: return 'empty'
+
+    await on_status("⏳ `Step 2/3:` Intelligently grouping files by similarity...", False)
+    assignments = await group_titles_async(
+        [title for _, title in entries],
+        on_progress=lambda done, total: on_status(f"⏳ `Step 2/3:` Intelligently grouping files by similarity... ({done} / {total})", False)
+    )
+    batches = [[] for _ in range(max(assignments) + 1)]
+    for (file_id, _), batch_index in zip(entries, assignments):
+        batches[batch_index].append(file_id)
+    del entries, assignments
+    total_batches = len(batches)
+    if start_batch:
+        await on_status(f"♻️ `Step 2/3:` Resuming previous backup from post **{start_batch + 1}** of **{total_batches}**...", True)
+    else:
+        await on_status(f"✅ `Step 2/3:` Found **{total_batches}** unique posts to create. Starting backup...", True)
+
+    queue = asyncio.Queue(maxsize=RENDER_AHEAD)
+    render_errors = []
+
+    async def renderer():
+        try:
+            async for index, batch_docs in _prefetch_batches(client, batches, start_batch):
+                if is_cancelled(): break
+                records = [BatchFile.from_doc(doc) for doc in batch_docs]
+                await queue.put((index, await create_post(client, owner_id, records) if records else []))
+        except Exception as e:
+            render_errors.append(e)
+        finally:
+            await queue.put(None)
+
+    render_task = asyncio.create_task(renderer())
+    last_progress = 0
+    try:
+        while (item := await queue.get()) is not None:
+            index, posts = item
+            try:
+                for part in range(start_part if index == start_batch else 0, len(posts)):
+                    if is_cancelled(): return 'cancelled'
+                    poster, caption, footer = posts[part]
+                    if poster: await send_poster(client, channel_id, poster, caption, footer)
+                    else: await client.send_with_protection(client.send_message, channel_id, caption, reply_markup=footer, disable_web_page_preview=True)
+                    await save_backup_checkpoint(owner_id, channel_id, next_batch=index, next_part=part + 1)
+                    await asyncio.sleep(SEND_DELAY)
+            except Exception as e:
+                logger.exception(f"Failed to post batch during backup for user {owner_id}.")
+                await client.send_message(owner_id, f"Failed to back up a batch. Error: {e}")
+            await save_backup_checkpoint(owner_id, channel_id, next_batch=index + 1, next_part=0)
+            if time.monotonic() - last_progress >= PROGRESS_INTERVAL:
+                last_progress = time.monotonic()
+                await on_status(f"🔄 `Step 3/3:` Progress: {index + 1} / {total_batches} batches processed.", True)
+        if render_errors: raise render_errors[0]
+        if is_cancelled(): return 'cancelled'
+    finally:
+        render_task.cancel()
+    return 'completed'
@@ -1,22 +1,137 @@
 import asyncio
-from pyrogram.errors import FloodWait, UserIsBlocked, InputUserDeactivated
+import logging
+import time
+from pyrogram.errors import FloodWait, UserIsBlocked, InputUserDeactivated, PeerIdInvalid, MessageNotModified
+from database.db import create_broadcast, iter_broadcast_recipients, update_broadcast, get_running_broadcasts
+from utils.rate_limiter import TokenBucket
 
-async def broadcast_message(client, user_ids, message):
-    success_count = 0
-    fail_count = 0
-    
-    for user_id in user_ids:
+logger = logging.getLogger(__name__)
+
+BROADCAST_CONCURRENCY = 10
+BROADCAST_RATE = 25          # messages per second across all broadcasts (Telegram bot limit ~30/s)
+CLAIM_CHUNK = 20
+PROGRESS_INTERVAL = 10
+AUDIENCE_LABELS = {'all': "all users", 'storage': "storage owners", 'normal': "normal users"}
+
+_rate_limiter = TokenBucket(rate=BROADCAST_RATE)
+ACTIVE_BROADCASTS = set()
+
+
+async def _deliver(client, job, user_id):
+    """Copies the broadcast message to one user. Returns 'sent', 'blocked' or 'failed'."""
+    while True:
+        await _rate_limiter.acquire()
         try:
-            await message.copy(chat_id=user_id)
-            success_count += 1
-            await asyncio.sleep(0.1) # Add a small delay to avoid flood waits
+            await client.copy_message(chat_id=user_id, from_chat_id=job['source_chat_id'], message_id=job['message_id'])
+            return 'sent'
         except FloodWait as e:
-            await asyncio.sleep(e.value)
-            await message.copy(chat_id=user_id)
-            success_count += 1
-        except (UserIsBlocked, InputUserDeactivated):
-            fail_count += 1
-        except Exception:
-            fail_count += 1
-            
-    return success_count, fail_count
+            # FloodWait par saare broadcasts rukte hain, phir isi user ko dobara bheja jata hai
+            logger.warning(f"Broadcast hit FloodWait of {e.value}s. Pausing all sends.")
+            _rate_limiter.pause(e.value + 1)
+        except (UserIsBlocked, InputUserDeactivated, PeerIdInvalid):
+            return 'blocked'
+        except Exception as e:
+            logger.debug(f"Broadcast to {user_id} failed: {e}")
+            return 'failed'
+
+
+def _progress_text(job, counts, finished=False, started_at=None):
+    done = counts['sent'] + counts['blocked'] + counts['failed']
+    head = "✅ **Broadcast Complete**" if finished else f"📣 **Broadcasting to {AUDIENCE_LABELS[job['audience']]}...**"
+    text = (
+        f"{head}\n\n"
+        f"**Progress:** `{done}` / `{job['total']}`\n"
+        f"**Sent:** `{counts['sent']}`\n"
+        f"**Blocked / Deleted:** `{counts['blocked']}`\n"
+        f"**Failed:** `{counts['failed']}`"
+    )
+    if started_at and not finished:
+        elapsed = time.monotonic() - started_at
+        if elapsed > 0: text += f"\n**Speed:** `{(done - job['_done_at_start']) / elapsed:.1f}` msgs/s"
+    return text
+
+
+async def _edit_status(client, job, text):
+    try: await client.edit_message_text(job['status_chat_id'], job['status_message_id'], text)
+    except MessageNotModified: pass
+    except Exception as e: logger.warning(f"Could not update broadcast status message: {e}")
+
+
+async def run_broadcast(client, job):
+    """
+    Runs (or resumes) a broadcast job.
+
+    Recipients are streamed from Mongo in _id order and sent by BROADCAST_CONCURRENCY
+    workers under one global rate limiter. Each chunk of recipients is checkpointed
+    *before* it is sent, so a resumed job never messages anyone twice; at worst the
+    recipients of the chunk that was in flight during a crash miss this broadcast.
+    """
+    job_id = job['_id']
+    if job_id in ACTIVE_BROADCASTS: return
+    ACTIVE_BROADCASTS.add(job_id)
+    counts = {key: job.get(key, 0) for key in ('sent', 'blocked', 'failed')}
+    job['_done_at_start'] = sum(counts.values())
+    queue = asyncio.Queue(maxsize=BROADCAST_CONCURRENCY)
+    started_at = time.monotonic()
+
+    async def producer():
+        chunk = []
+        async for doc in iter_broadcast_recipients(job['audience'], job.get('position')):
+            chunk.append(doc)
+            if len(chunk) >= CLAIM_CHUNK:
+                await claim(chunk); chunk = []
+        if chunk: await claim(chunk)
+        for _ in range(BROADCAST_CONCURRENCY): await queue.put(None)
+
+    async def claim(chunk):
+        # Bhejne se pehle position aage badhao, taaki crash ke baad kisi ko duplicate na mile
+        await update_broadcast(job_id, position=chunk[-1]['_id'], **counts)
+        for doc in chunk: await queue.put(doc['user_id'])
+
+    async def worker():
+        while (user_id := await queue.get()) is not None:
+            counts[await _deliver(client, job, user_id)] += 1
+
+    async def reporter():
+        while True:
+            await asyncio.sleep(PROGRESS_INTERVAL)
+            try: await update_broadcast(job_id, **counts)
+            except Exception as e: logger.warning(f"Could not save broadcast {job_id} counters: {e}")
+            await _edit_status(client, job, _progress_text(job, counts, started_at=started_at))
+
+    tasks = [asyncio.create_task(producer())] + [asyncio.create_task(worker()) for _ in range(BROADCAST_CONCURRENCY)]
+    reporter_task = asyncio.create_task(reporter())
+    try:
+        await asyncio.gather(*tasks)
+        await update_broadcast(job_id, status='completed', **counts)
+        await _edit_status(client, job, _progress_text(job, counts, finished=True))
+        logger.info(f"Broadcast {job_id} completed: {counts}")
+    except asyncio.CancelledError:
+        # Bot band ho raha hai: job 'running' hi rahega aur agle start par resume hoga
+        raise
+    except Exception as e:
+        logger.exception(f"Broadcast {job_id} failed.")
+        await update_broadcast(job_id, status='failed', error=str(e), **counts)
+        await _edit_status(client, job, f"❌ **Broadcast stopped:** `{e}`\n\n" + _progress_text(job, counts))
+    finally:
+        for task in tasks + [reporter_task]: task.cancel()
+        ACTIVE_BROADCASTS.discard(job_id)
+
+
+async def start_broadcast(client, source_chat_id, message_id, audience, status_message):
+    """Creates a broadcast job and runs it in the background. `status_message` becomes the live progress message."""
+    job = await create_broadcast(source_chat_id, message_id, audience, status_message.chat.id, status_message.id)
+    await _edit_status(client, job, _progress_text(job, {'sent': 0, 'blocked': 0, 'failed': 0}))
+    asyncio.create_task(run_broadcast(client, job))
+    return job
+
+
+async def resume_broadcasts(client):
+    """Started from Bot.start: picks up broadcasts that were still running when the bot stopped."""
+    try:
+        jobs = await get_running_broadcasts()
+    except Exception as e:
+        return logger.error(f"Could not load unfinished broadcasts: {e}")
+    for job in jobs:
+        logger.info(f"Resuming broadcast {job['_id']} ({job['audience']}).")
+        asyncio.create_task(run_broadcast(client, job))
@@ -0,0 +1,86 @@
+import asyncio
+import logging
+from pyrogram.errors import UserNotParticipant
+from database.db import get_fsub_invite_link, save_fsub_invite_link, delete_fsub_invite_link
+from utils.cache import TTLCache
+from utils.channel_registry import channel_registry, ACCESS_ERRORS
+
+logger = logging.getLogger(__name__)
+
+MEMBER_TTL = 5 * 60
+NON_MEMBER_TTL = 10          # join karke turant Retry dabane wale ko zyada der na roke
+MEMBERSHIP_CACHE_SIZE = 50000
+INVITE_LINK_MEMORY_TTL = 6 * 60 * 60
+INVITE_LINK_NAME = "FSub"
+_membership = TTLCache(maxsize=MEMBERSHIP_CACHE_SIZE, ttl=MEMBER_TTL)  # (channel, user) -> (channel, joined)
+_invite_links = TTLCache(maxsize=5000, ttl=INVITE_LINK_MEMORY_TTL)
+_invite_lookups = {}
+
+
+class FSubChannelError(Exception):
+    """The bot can no longer check members of the FSub channel (removed, not admin, channel deleted)."""
+
+
+async def is_fsub_member(client, channel_id, user_id, recheck=False):
+    """
+    Whether `user_id` has joined the FSub channel. Members are cached for MEMBER_TTL and
+    non-members for NON_MEMBER_TTL; `recheck=True` (the Retry button) ignores a cached "no".
+    The bot's own access comes from channel_registry, so a cached answer needs no API call.
+    Raises FSubChannelError when the bot has lost access to the channel.
+    """
+    key = (channel_id, user_id)
+    cached = _membership.get(key)
+    if cached is not None and (cached[1] or not recheck): return cached[1]
+
+    status = await channel_registry.check(client, channel_id)
+    if status is not None and not status.accessible:
+        raise FSubChannelError(f"Bot is not an admin of channel {channel_id}")
+    try:
+        await client.get_chat_member(chat_id=channel_id, user_id=user_id)
+        joined = True
+    except UserNotParticipant:
+        joined = False
+    except ACCESS_ERRORS as e:
+        raise FSubChannelError(str(e)) from e
+    _membership.set(key, (channel_id, joined), ttl=MEMBER_TTL if joined else NON_MEMBER_TTL)
+    return joined
+
+
+async def _load_invite_link(client, channel_id):
+    try:
+        link = await get_fsub_invite_link(channel_id)
+    except Exception as e:
+        logger.warning(f"Invite link cache read failed: {e}")
+        link = None
+    if not link:
+        # export_chat_invite_link har baar primary link badal deta hai; apna ek alag link banao aur wahi rakho
+        try:
+            link = (await client.create_chat_invite_link(channel_id, name=INVITE_LINK_NAME)).invite_link
+        except Exception as e:
+            logger.warning(f"Could not create an invite link for FSub channel {channel_id}: {e}")
+            return None
+        try: await save_fsub_invite_link(channel_id, link)
+        except Exception as e: logger.warning(f"Invite link cache write failed: {e}")
+    _invite_links.set(channel_id, link)
+    return link
+
+
+async def get_fsub_link(client, channel_id):
+    """A stable invite link for the FSub channel, created once and reused. None if the bot cannot create one."""
+    link = _invite_links.get(channel_id)
+    if link: return link
+    task = _invite_lookups.get(channel_id)
+    if task is None:
+        task = asyncio.ensure_future(_load_invite_link(client, channel_id))
+        _invite_lookups[channel_id] = task
+        task.add_done_callback(lambda _: _invite_lookups.pop(channel_id, None))
+    return await asyncio.shield(task)
+
+
+async def forget_fsub_channel(channel_id):
+    """Drops everything cached for a channel: bot access, memberships and the stored invite link."""
+    channel_registry.invalidate(channel_id)
+    _membership.drop_where(lambda entry: entry[0] == channel_id)
+    _invite_links.pop(channel_id)
+    try: await delete_fsub_invite_link(channel_id)
+    except Exception as e: logger.warning(f"Could not delete the stored invite link of {channel_id}: {e}")
@@ -1,12 +1,47 @@
 import asyncio
+import datetime
 import aiohttp
 from bs4 import BeautifulSoup
 import logging
 import re
+from pyrogram.errors import (
+    MediaEmpty, FileIdInvalid, FileReferenceExpired, FileReferenceInvalid,
+    WebpageMediaEmpty, WebpageCurlFailed, PhotoInvalidDimensions
+)
 from config import Config
+from database.db import get_cached_poster, save_cached_poster, set_poster_file_id
+from utils.cache import TTLCache
+from utils.http import get_http_session
 
 logger = logging.getLogger(__name__)
 
+POSTER_HIT_TTL = datetime.timedelta(days=30)
+POSTER_MISS_TTL = datetime.timedelta(hours=24)
+POSTER_MEMORY_SIZE = 2000
+_NO_POSTER = ''  # cached value for a title that has no poster
+_poster_memory = TTLCache(maxsize=POSTER_MEMORY_SIZE, ttl=POSTER_MISS_TTL.total_seconds())
+_poster_lookups = {}
+_poster_keys = TTLCache(maxsize=POSTER_MEMORY_SIZE * 2, ttl=POSTER_MISS_TTL.total_seconds())  # url / file_id -> cache key
+_uploaded_posters = TTLCache(maxsize=POSTER_MEMORY_SIZE, ttl=POSTER_MISS_TTL.total_seconds())  # url -> file_id
+_upload_urls = TTLCache(maxsize=POSTER_MEMORY_SIZE, ttl=POSTER_MISS_TTL.total_seconds())  # file_id -> url
+_upload_locks = {}
+# Poster bhejne mein ye errors aayen to post bina poster ke text ke roop mein chala jata hai
+POSTER_SEND_ERRORS = (
+    MediaEmpty, FileIdInvalid, FileReferenceExpired, FileReferenceInvalid,
+    WebpageMediaEmpty, WebpageCurlFailed, PhotoInvalidDimensions, ValueError
+)
+POSTER_CONCURRENCY = 4
+LOOKUP_TIMEOUT = aiohttp.ClientTimeout(total=10)
+IMDB_HEADERS = {'User-Agent': 'Mozilla/5.0', 'Accept-Language': 'en-US,en;q=0.5'}
+POSTER_DEADLINE = 20
+POSTER_ERROR_RETRY = datetime.timedelta(minutes=10)
+_KEY_NON_ALNUM_RE = re.compile(r'[\W_]+')
+_WHITESPACE_RE = re.compile(r'\s+')
+
+class PosterLookupError(Exception):
+    """A poster source could not answer (HTTP error, 429, timeout, network failure), as opposed to finding nothing."""
+
+
 def generate_search_queries(title: str):
     """Generates a list of progressively shorter search queries from a title."""
     words = title.split()
@@ -18,72 +53,231 @@ def generate_search_queries(title: str):
     return list(dict.fromkeys(queries)) # Return unique queries
 
 async def _find_poster_from_imdb(query: str):
-    """Internal function to get the best-guess poster from IMDb for a single query."""
+    """
+    Internal function to get the best-guess poster from IMDb for a single query.
+    Returns None when IMDb has no poster and raises PosterLookupError when it could not be asked.
+    """
     try:
-        search_url = f"https://www.imdb.com/find?q={re.sub(r'\s+', '+', query)}"
-        headers = {'User-Agent': 'Mozilla/5.0', 'Accept-Language': 'en-US,en;q=0.5'}
-        async with aiohttp.ClientSession(headers=headers) as session:
-            async with session.get(search_url, timeout=10) as resp:
-                if resp.status != 200: return None
-                soup = BeautifulSoup(await resp.text(), 'html.parser')
-                result_link = soup.select_one("a.ipc-metadata-list-summary-item__t")
-                if not result_link or not result_link.get('href'): return None
-                
-                movie_url = "https://www.imdb.com" + result_link['href'].split('?')[0]
-                async with session.get(movie_url, timeout=10) as movie_resp:
-                    if movie_resp.status != 200: return None
-                    movie_soup = BeautifulSoup(await movie_resp.text(), 'html.parser')
-                    img_tag = movie_soup.select_one('div[data-testid="hero-media__poster"] img.ipc-image')
-                    if img_tag and img_tag.get('src'):
-                        poster_url = img_tag['src'].split('_V1_')[0] + "_V1_FMjpg_UX1000_.jpg"
-                        return poster_url
-    except Exception:
-        return None
+        search_url = f"https://www.imdb.com/find?q={_WHITESPACE_RE.sub('+', query)}"
+        session = get_http_session()
+        async with session.get(search_url, headers=IMDB_HEADERS, timeout=LOOKUP_TIMEOUT) as resp:
+            if resp.status != 200: raise PosterLookupError(f"IMDb search returned HTTP {resp.status}")
+            soup = BeautifulSoup(await resp.text(), 'html.parser')
+            result_link = soup.select_one("a.ipc-metadata-list-summary-item__t")
+            if not result_link or not result_link.get('href'): return None
+            
+            movie_url = "https://www.imdb.com" + result_link['href'].split('?')[0]
+        async with session.get(movie_url, headers=IMDB_HEADERS, timeout=LOOKUP_TIMEOUT) as movie_resp:
+            if movie_resp.status != 200: raise PosterLookupError(f"IMDb title page returned HTTP {movie_resp.status}")
+            movie_soup = BeautifulSoup(await movie_resp.text(), 'html.parser')
+            img_tag = movie_soup.select_one('div[data-testid="hero-media__poster"] img.ipc-image')
+            if img_tag and img_tag.get('src'):
+                poster_url = img_tag['src'].split('_V1_')[0] + "_V1_FMjpg_UX1000_.jpg"
+                return poster_url
+    except PosterLookupError:
+        raise
+    except Exception as e:
+        raise PosterLookupError(f"IMDb lookup for '{query}' failed: {e!r}") from e
     return None
 
 async def _find_poster_from_tmdb(query: str, year: str = None):
-    """Internal function to get the best-guess poster from TMDB for a single query."""
+    """Internal function to get the best-guess poster from TMDB for a single query. Same contract as the IMDb lookup."""
     if not Config.TMDB_API_KEY: return None
     try:
         search_url = "https://api.themoviedb.org/3/search/multi"
         params = {"api_key": Config.TMDB_API_KEY, "query": query, "include_adult": "false"}
         if year: params['year'] = year
-        async with aiohttp.ClientSession() as session:
-            async with session.get(search_url, params=params, timeout=10) as resp:
-                if resp.status != 200: return None
-                data = await resp.json()
-                if data.get('results') and data['results'][0].get("poster_path"):
-                    return f"https://image.tmdb.org/t/p/w500{data['results'][0]['poster_path']}"
-    except Exception:
-        return None
+        async with get_http_session().get(search_url, params=params, timeout=LOOKUP_TIMEOUT) as resp:
+            if resp.status != 200: raise PosterLookupError(f"TMDB returned HTTP {resp.status}")
+            data = await resp.json()
+            if data.get('results') and data['results'][0].get("poster_path"):
+                return f"https://image.tmdb.org/t/p/w500{data['results'][0]['poster_path']}"
+    except PosterLookupError:
+        raise
+    except Exception as e:
+        raise PosterLookupError(f"TMDB lookup for '{query}' failed: {e!r}") from e
     return None
 
+def _task_poster(task):
+    """A finished lookup's poster, or None if it found nothing, errored or was cancelled."""
+    if task.cancelled() or task.exception(): return None
+    return task.result()
+
+def _poster_candidates(query: str, year: str = None):
+    """(label, query, coroutine factory) for every lookup, in preference order."""
+    candidates = []
+    for sq in generate_search_queries(query):
+        # IMDb pehle (user preference), TMDB API fallback
+        if year: candidates.append(("IMDb with year", sq, lambda sq=sq: _find_poster_from_imdb(f"{sq} {year}")))
+        candidates.append(("IMDb without year", sq, lambda sq=sq: _find_poster_from_imdb(sq)))
+        if year: candidates.append(("TMDB with year", sq, lambda sq=sq: _find_poster_from_tmdb(sq, year)))
+        candidates.append(("TMDB without year", sq, lambda sq=sq: _find_poster_from_tmdb(sq)))
+    return candidates
+
+async def _search_poster(query: str, year: str = None):
+    """
+    Racing poster finder. Every (query, source) candidate of the old waterfall runs
+    concurrently, at most POSTER_CONCURRENCY at a time, started in preference order.
+    A result is only accepted once every more preferred candidate has failed, so the
+    outcome matches the waterfall; less preferred lookups are cancelled as soon as a
+    better one succeeds. A candidate that errors counts as failed for that ordering.
+    Returns None only when every source answered without a poster: raises
+    PosterLookupError if nothing was found but some source errored, and
+    asyncio.TimeoutError if the POSTER_DEADLINE passes before any candidate succeeds.
+    """
+    candidates = _poster_candidates(query, year)
+    semaphore = asyncio.Semaphore(POSTER_CONCURRENCY)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + POSTER_DEADLINE
+
+    async def run(factory):
+        async with semaphore:
+            return await factory()
+
+    tasks = [asyncio.create_task(run(factory)) for _, _, factory in candidates]
+    try:
+        pending = set(tasks)
+        while True:
+            winner = None
+            for index, task in enumerate(tasks):
+                if not task.done(): break
+                if _task_poster(task): winner = index; break
+            else:
+                errors = [task.exception() for task in tasks if not task.cancelled() and task.exception()]
+                if errors: raise PosterLookupError(f"Poster search for '{query}' failed on {len(errors)} lookups: {errors[0]}")
+                logger.error(f"Poster Search: All attempts failed for base query '{query}'.")
+                return None
+            # Kisi behtar candidate ki success ke baad peeche wale kisi kaam ke nahi
+            best_so_far = next((i for i, t in enumerate(tasks) if t.done() and _task_poster(t)), None)
+            if best_so_far is not None:
+                for task in tasks[best_so_far + 1:]: task.cancel()
+            if winner is not None:
+                label, sq, _ = candidates[winner]
+                logger.info(f"SUCCESS: {label} for '{sq}'")
+                return tasks[winner].result()
+
+            pending = {task for task in pending if not task.done()}
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                if best_so_far is not None:
+                    label, sq, _ = candidates[best_so_far]
+                    logger.info(f"Poster Search: deadline reached, using {label} for '{sq}'")
+                    return tasks[best_so_far].result()
+                raise asyncio.TimeoutError(f"Poster search for '{query}' exceeded {POSTER_DEADLINE}s")
+            await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks: task.cancel()
+
+def poster_cache_key(query: str, year: str = None):
+    normalized = _KEY_NON_ALNUM_RE.sub(' ', query.lower()).strip()
+    return f"{normalized}|{year or ''}"
+
+def _remember(key, poster, expires_at):
+    ttl = (expires_at - datetime.datetime.utcnow()).total_seconds()
+    if ttl <= 0: return
+    _poster_memory.set(key, poster or _NO_POSTER, ttl=ttl)
+    if poster: _poster_keys.set(poster, key, ttl=ttl)
+
+async def _lookup_and_store(key, query, year):
+    try:
+        cached = await get_cached_poster(key)
+        if cached:
+            poster = cached.get('file_id') or cached['url']
+            if cached.get('file_id'): _upload_urls.set(cached['file_id'], cached['url'])
+            _remember(key, poster, cached['expires_at'])
+            return poster
+    except Exception as e:
+        logger.warning(f"Poster cache read failed for '{key}': {e}")
+
+    try:
+        poster = await _search_poster(query, year)
+    except (asyncio.TimeoutError, PosterLookupError) as e:
+        # Timeout ya source error asli "miss" nahi hai, isliye sirf memory mein thodi der ke liye yaad rakho
+        logger.warning(str(e))
+        _remember(key, None, datetime.datetime.utcnow() + POSTER_ERROR_RETRY)
+        return None
+    expires_at = datetime.datetime.utcnow() + (POSTER_HIT_TTL if poster else POSTER_MISS_TTL)
+    _remember(key, poster, expires_at)
+    try: await save_cached_poster(key, poster, expires_at)
+    except Exception as e: logger.warning(f"Poster cache write failed for '{key}': {e}")
+    return poster
+
 async def get_poster(query: str, year: str = None):
     """
-    The definitive 'waterfall' poster finder. It tries every possible combination
-    of truncated queries and sources until it gets a match.
+    Cached poster lookup keyed by normalized title and year. Memory is checked first,
+    then the Mongo posters collection, and only then the network waterfall. Hits are
+    kept for 30 days and confirmed misses for 24 hours; a search that timed out or hit
+    source errors is retried after 10 minutes. Concurrent lookups of one title share a search.
+    Returns the Telegram file_id once the poster has been uploaded, otherwise its URL.
     """
-    search_queries = generate_search_queries(query)
-    logger.info(f"Waterfall Search: Starting for '{query}'. Queries: {search_queries}")
-
-    for sq in search_queries:
-        logger.info(f"Waterfall Search: Trying query '{sq}'...")
-        
-        # --- IMDb First (User Preference) ---
-        if year:
-            poster = await _find_poster_from_imdb(f"{sq} {year}")
-            if poster: logger.info(f"SUCCESS: IMDb with year for '{sq}'"); return poster
-        
-        poster = await _find_poster_from_imdb(sq)
-        if poster: logger.info(f"SUCCESS: IMDb without year for '{sq}'"); return poster
-        
-        # --- TMDB Second (API Fallback) ---
-        if year:
-            poster = await _find_poster_from_tmdb(sq, year)
-            if poster: logger.info(f"SUCCESS: TMDB with year for '{sq}'"); return poster
-        
-        poster = await _find_poster_from_tmdb(sq)
-        if poster: logger.info(f"SUCCESS: TMDB without year for '{sq}'"); return poster
-
-    logger.error(f"Waterfall Search: All attempts failed for base query '{query}'.")
-    return None
+    key = poster_cache_key(query, year)
+    cached = _poster_memory.get(key)
+    if cached is not None: return cached or None
+
+    task = _poster_lookups.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_lookup_and_store(key, query, year))
+        _poster_lookups[key] = task
+        task.add_done_callback(lambda _: _poster_lookups.pop(key, None))
+    return await asyncio.shield(task)
+
+
+async def _record_upload(url, file_id):
+    _uploaded_posters.set(url, file_id)
+    _upload_urls.set(file_id, url)
+    key = _poster_keys.get(url)
+    if not key: return
+    _poster_memory.set(key, file_id)
+    _poster_keys.set(file_id, key)
+    try: await set_poster_file_id(key, file_id)
+    except Exception as e: logger.warning(f"Could not store poster file_id for '{key}': {e}")
+
+async def _forget_upload(file_id):
+    """Drops a rejected file_id everywhere it is cached. Returns the poster URL it was uploaded from, if known."""
+    url = _upload_urls.pop(file_id)
+    if url and _uploaded_posters.get(url) == file_id: _uploaded_posters.pop(url)
+    key = _poster_keys.pop(file_id)
+    if not key: return url
+    _poster_memory.pop(key)
+    try: await set_poster_file_id(key, None)
+    except Exception as e: logger.warning(f"Could not clear poster file_id for '{key}': {e}")
+    return url
+
+async def send_poster(client, chat_id, poster, caption, reply_markup=None, reupload=True):
+    """
+    send_photo for post posters. A poster URL is uploaded to Telegram once: the first
+    send doubles as the upload, its photo file_id goes into the poster cache, and every
+    later send (to any channel) reuses the file_id. Concurrent sends of one URL wait for
+    that first upload. If Telegram rejects a cached file_id, the poster is uploaded again
+    from its URL once; if it rejects the poster itself, the post goes out as plain text.
+    """
+    is_url = poster.startswith(("http://", "https://"))
+    if is_url:
+        file_id = _uploaded_posters.get(poster)
+        if not file_id:
+            lock = _upload_locks.setdefault(poster, asyncio.Lock())
+            try:
+                async with lock:
+                    file_id = _uploaded_posters.get(poster)
+                    if not file_id:
+                        try:
+                            message = await client.send_with_protection(client.send_photo, chat_id, poster, caption=caption, reply_markup=reply_markup)
+                        except POSTER_SEND_ERRORS as e:
+                            logger.warning(f"Telegram could not fetch poster {poster}: {e}. Sending post without it.")
+                            return await client.send_with_protection(client.send_message, chat_id, caption, reply_markup=reply_markup, disable_web_page_preview=True)
+                        if message and message.photo: await _record_upload(poster, message.photo.file_id)
+                        return message
+            finally:
+                if not lock.locked() and _upload_locks.get(poster) is lock: del _upload_locks[poster]
+        poster = file_id
+
+    try:
+        return await client.send_with_protection(client.send_photo, chat_id, poster, caption=caption, reply_markup=reply_markup)
+    except POSTER_SEND_ERRORS as e:
+        url = await _forget_upload(poster)
+        if url and reupload:
+            # Purana file_id mar gaya: URL se dobara upload karo, naya file_id cache mein chala jayega
+            logger.warning(f"Cached poster file_id was rejected ({e}). Re-uploading from {url}.")
+            return await send_poster(client, chat_id, url, caption, reply_markup, reupload=False)
+        logger.warning(f"Cached poster file_id was rejected ({e}). Sending post without it.")
+        return await client.send_with_protection(client.send_message, chat_id, caption, reply_markup=reply_markup, disable_web_page_preview=True)
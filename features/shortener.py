@@ -1,42 +1,204 @@
 import aiohttp
 import asyncio
+import hashlib
 import logging
-from database.db import get_user
+import time
+from database.db import get_user, get_cached_shortlink, save_cached_shortlink
+from utils.cache import TTLCache
+from utils.circuit_breaker import BreakerRegistry
+from utils.http import get_http_session
 
 logger = logging.getLogger(__name__)
+SHORTENER_TIMEOUT = 10
+PROBE_INTERVAL = 15
 
-async def get_shortlink(link_to_shorten, user_id):
+SHORTLINK_MEMORY_SIZE = 10000
+SHORTLINK_MEMORY_TTL = 6 * 60 * 60
+PREGEN_QUEUE_SIZE = 5000
+PREGEN_DELAY = 1
+_shortlink_memory = TTLCache(maxsize=SHORTLINK_MEMORY_SIZE, ttl=SHORTLINK_MEMORY_TTL)
+_shortlink_lookups = {}
+_pregen_queue = asyncio.Queue(maxsize=PREGEN_QUEUE_SIZE)
+shortener_breakers = BreakerRegistry()
+
+
+class ShortenerUnavailable(Exception):
+    """The provider itself failed: timeout, connection error or a 5xx response. Counts against its circuit."""
+
+
+class ShortenerRejected(Exception):
+    """The provider answered 4xx, e.g. one owner's invalid or revoked API key. Says nothing about provider health."""
+
+
+def _check_status(domain, status):
+    if status >= 500: raise ShortenerUnavailable(f"{domain} returned HTTP {status}")
+    if status >= 400: raise ShortenerRejected(f"{domain} returned HTTP {status}")
+
+
+def shortlink_cache_key(owner_id, domain, api, target):
+    # API key bhi key mein hai taaki naya API key purane account ke links na lautaye
+    api_hash = hashlib.sha1(api.encode()).hexdigest()[:12]
+    return f"{owner_id}|{domain}|{api_hash}|{target}"
+
+
+async def _call_shortener(domain, api, link_to_shorten, timeout):
     """
-    Shortens the provided link using the user's settings.
-    Now includes a retry mechanism for better reliability.
+    One API call. Returns the short URL, or None if the provider answered without one.
+    Raises ShortenerRejected on 4xx and ShortenerUnavailable when the provider failed.
     """
-    user = await get_user(user_id)
-    if not user or not user.get('shortener_enabled') or not user.get('shortener_url'):
-        return link_to_shorten
+    url = f'https://{domain}/api'
+    params = {'api': api, 'url': link_to_shorten}
+    try:
+        async with get_http_session().get(url, params=params, ssl=False, timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+            _check_status(domain, response.status)
+            data = await response.json(content_type=None)
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        raise ShortenerUnavailable(f"{domain}: {e!r}") from e
+    if data.get("status") == "success" and data.get("shortenedUrl"):
+        return data["shortenedUrl"]
+    logger.error(f"Shortener API error from {domain}: {data.get('message', 'Unknown error')}")
+    return None
 
-    URL = user['shortener_url'].strip()
-    API = user['shortener_api'].strip()
 
+async def _shorten(domain, api, link_to_shorten, user_id):
+    """
+    Calls the shortener API with up to 3 attempts. Returns the short URL or None.
+    Skips the provider straight away while its circuit is open, and scales the
+    per-attempt timeout to its recent latency.
+    """
+    breaker = shortener_breakers.get(domain)
     # Retry logic: Attempt the API call up to 3 times
     for attempt in range(3):
+        if not breaker.allow_request():
+            logger.warning(f"Shortener {domain} is unhealthy (circuit {breaker.state}). Skipping shortening for user {user_id}.")
+            return None
+        started = time.monotonic()
         try:
-            url = f'https://{URL}/api'
-            params = {'api': API, 'url': link_to_shorten}
-            
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, params=params, raise_for_status=True, ssl=False, timeout=10) as response:
-                    data = await response.json(content_type=None)
-                    if data.get("status") == "success" and data.get("shortenedUrl"):
-                        return data["shortenedUrl"]  # Success, return the link and exit the loop
-                    else:
-                        logger.error(f"Shortener API error (Attempt {attempt + 1}/3): {data.get('message', 'Unknown error')}")
+            short_url = await _call_shortener(domain, api, link_to_shorten, breaker.suggested_timeout(SHORTENER_TIMEOUT))
+            # Provider ne jawab diya to woh healthy hai, chahe user ka API key galat ho
+            breaker.record(True, time.monotonic() - started)
+            if short_url: return short_url
+        except ShortenerRejected as e:
+            # 4xx is owner ki galti (API key waghera); provider ke circuit par asar nahi, retry bhi bekaar
+            logger.error(f"Shortener {domain} rejected the request for user {user_id}: {e}")
+            return None
+        except ShortenerUnavailable as e:
+            breaker.record(False, time.monotonic() - started)
+            logger.error(f"HTTP Error during shortening via {domain} (Attempt {attempt + 1}/3): {e}")
         except Exception as e:
-            logger.error(f"HTTP Error during shortening (Attempt {attempt + 1}/3): {e}")
-        
+            # Ajeeb jawab (JSON nahi) provider ki health ka saboot nahi, isliye circuit ko mat chhuo
+            logger.error(f"Unexpected response from shortener {domain} for user {user_id}: {e!r}")
+            return None
+
         # If not the last attempt, wait for 1 second before retrying
         if attempt < 2:
             await asyncio.sleep(1)
 
+    logger.error(f"All shortener attempts failed for user {user_id}.")
+    return None
+
+
+async def _probe_shortener(domain):
+    """A credential-free request to the provider's API endpoint: any answer below 500 means it is up."""
+    try:
+        async with get_http_session().get(f'https://{domain}/api', ssl=False, timeout=aiohttp.ClientTimeout(total=SHORTENER_TIMEOUT)) as response:
+            if response.status >= 500: raise ShortenerUnavailable(f"{domain} returned HTTP {response.status}")
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        raise ShortenerUnavailable(f"{domain}: {e!r}") from e
+
+
+async def run_shortener_probes():
+    """
+    Background task started in Bot.start. Once an open circuit's cooldown is over, one
+    neutral request without any owner's API key decides whether it closes.
+    """
+    while True:
+        await asyncio.sleep(PROBE_INTERVAL)
+        for breaker in shortener_breakers:
+            if not breaker.probe_due(): continue
+            started = time.monotonic()
+            try:
+                await _probe_shortener(breaker.name)
+                breaker.record(True, time.monotonic() - started)
+                logger.info(f"Shortener {breaker.name} is reachable again. Circuit closed.")
+            except Exception as e:
+                breaker.record(False, time.monotonic() - started)
+                logger.warning(f"Shortener {breaker.name} probe failed ({e}). Next probe in {breaker.open_for}s.")
+
+
+def shortener_stats():
+    """Per shortener domain: circuit state, call and failure counts, error rate and p50/p95 latency (seconds)."""
+    return shortener_breakers.stats()
+
+
+async def _lookup_or_shorten(key, domain, api, link_to_shorten, user_id):
+    try:
+        cached = await get_cached_shortlink(key)
+        if cached:
+            _shortlink_memory.set(key, cached)
+            return cached
+    except Exception as e:
+        logger.warning(f"Shortlink cache read failed: {e}")
+
+    short_url = await _shorten(domain, api, link_to_shorten, user_id)
+    if short_url:
+        _shortlink_memory.set(key, short_url)
+        try: await save_cached_shortlink(key, user_id, domain, link_to_shorten, short_url)
+        except Exception as e: logger.warning(f"Shortlink cache write failed: {e}")
+    return short_url
+
+
+async def get_shortlink(link_to_shorten, user_id):
+    """
+    Shortens the provided link using the user's settings.
+    Shortlinks are cached per (owner, shortener domain, API key, target URL) in memory and
+    in Mongo, so a link is only sent to the shortener once; concurrent requests for the
+    same link share one API call. Falls back to the original link if shortening fails.
+    """
+    user = await get_user(user_id)
+    if not user or not user.get('shortener_enabled') or not user.get('shortener_url'):
+        return link_to_shorten
+
+    URL = user['shortener_url'].strip()
+    API = (user.get('shortener_api') or '').strip()
+    key = shortlink_cache_key(user_id, URL, API, link_to_shorten)
+    cached = _shortlink_memory.get(key)
+    if cached: return cached
+
+    task = _shortlink_lookups.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_lookup_or_shorten(key, URL, API, link_to_shorten, user_id))
+        _shortlink_lookups[key] = task
+        task.add_done_callback(lambda _: _shortlink_lookups.pop(key, None))
+    short_url = await asyncio.shield(task)
+    if short_url: return short_url
+
     # If all attempts fail, log it and return the original link as a fallback
-    logger.error(f"All shortener attempts failed for user {user_id}. Returning original link.")
+    logger.error(f"Shortening failed for user {user_id}. Returning original link.")
     return link_to_shorten
+
+
+def queue_shortlinks(owner_id, file_unique_ids):
+    """Queues delivery links of freshly published files for background shortening. Never blocks."""
+    for file_unique_id in file_unique_ids:
+        try: _pregen_queue.put_nowait((owner_id, file_unique_id))
+        except asyncio.QueueFull:
+            logger.warning("Shortlink pre-generation queue is full. Skipping the rest of this batch.")
+            return
+
+
+async def run_shortlink_worker(client):
+    """Background worker started in Bot.start: shortens queued delivery links ahead of the first click."""
+    logger.info("Shortlink pre-generation worker started.")
+    while True:
+        owner_id, file_unique_id = await _pregen_queue.get()
+        try:
+            user = await get_user(owner_id)
+            if user and user.get('shortener_enabled') and user.get('shortener_url'):
+                final_delivery_link = f"https://t.me/{client.me.username}?start=finalget_{file_unique_id}"
+                await get_shortlink(final_delivery_link, owner_id)
+                await asyncio.sleep(PREGEN_DELAY)
+        except Exception as e:
+            logger.error(f"Shortlink pre-generation failed for {file_unique_id}: {e}")
+        finally:
+            _pregen_queue.task_done()
@@ -4,11 +4,11 @@ from pyrogram import Client, filters
 from pyrogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from config import Config
 from database.db import (
-    total_users_count, get_all_user_ids, get_storage_owners_count,
-    get_storage_owner_ids, get_normal_user_ids, delete_all_files,
+    total_users_count, get_storage_owners_count, delete_all_files,
     set_owner_db_channel, set_stream_channel  # <-- Import set_stream_channel
 )
-from features.broadcaster import broadcast_message
+from features.broadcaster import start_broadcast
+from features.shortener import shortener_stats
 from utils.helpers import go_back_button
 
 logger = logging.getLogger(__name__)
@@ -86,6 +86,20 @@ async def stats_handler(_, message):
     except Exception:
         logger.exception("Error in /stats handler")
         await message.reply_text("An error occurred while fetching stats.")
+@Client.on_message(filters.command("shortener_stats") & filters.user(Config.ADMIN_ID))
+async def shortener_stats_handler(_, message):
+    stats = shortener_stats()
+    if not stats: return await message.reply_text("No shortener calls since the last restart.")
+    text = "🔗 **Shortener Health**\n\n"
+    for domain, s in sorted(stats.items()):
+        p50 = f"{s['p50']:.2f}s" if s['p50'] is not None else "-"
+        p95 = f"{s['p95']:.2f}s" if s['p95'] is not None else "-"
+        text += (
+            f"**{domain}** — `{s['state']}`\n"
+            f"Calls: `{s['calls']}` | Failures: `{s['failures']}` | Recent errors: `{s['error_rate']:.0%}`\n"
+            f"Latency p50: `{p50}` | p95: `{p95}`\n\n"
+        )
+    await message.reply_text(text)
 @Client.on_message(filters.command("broadcast") & filters.user(Config.ADMIN_ID))
 async def broadcast_prompt_handler(client, message):
     if not message.reply_to_message:
@@ -102,21 +116,13 @@ async def broadcast_callback_handler(client, query):
     try:
         broadcast_type, message_id_str = query.data.split("_")[1:]
         message_id = int(message_id_str)
-        await query.message.edit_text("Fetching user list... Please wait.")
         message_to_broadcast = await client.get_messages(chat_id=query.message.chat.id, message_ids=message_id)
-        if not message_to_broadcast:
+        if not message_to_broadcast or message_to_broadcast.empty:
             return await query.message.edit_text("Error: Could not find the original message.")
         
-        if broadcast_type == "all":
-            user_ids = await get_all_user_ids()
-        elif broadcast_type == "storage":
-            user_ids = await get_storage_owner_ids()
-        else: # broadcast_type == "normal"
-            user_ids = await get_normal_user_ids()
-            
-        status_msg = await query.message.edit_text(f"Broadcasting to {len(user_ids)} users...")
-        success, fail = await broadcast_message(client, user_ids, message_to_broadcast)
-        await status_msg.edit_text(f"✅ **Broadcast Complete**\n\nSent to: `{success}` users.\nFailed for: `{fail}` users.")
+        # Job background mein chalta hai; yahi message live progress dikhayega
+        status_msg = await query.message.edit_text("Starting broadcast...")
+        await start_broadcast(client, query.message.chat.id, message_id, broadcast_type, status_msg)
     except Exception:
         logger.exception("Error in broadcast_callback_handler")
         await query.message.edit_text("An error occurred during broadcast.")
@@ -1,6 +1,8 @@
 import asyncio
-import base64
 import logging
+import secrets
+from collections import OrderedDict
+from bson import ObjectId
 from pyrogram import Client, filters
 from pyrogram.enums import ParseMode
 from pyrogram.types import InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery, Message
@@ -8,12 +10,18 @@ from pyrogram.errors import MessageNotModified
 from database.db import (
     get_user, update_user, add_to_list, remove_from_list,
     get_user_file_count, add_footer_button, remove_footer_button,
-    get_all_user_files, get_paginated_files, search_user_files
+    get_paginated_files, get_backup_checkpoint
 )
-from utils.helpers import go_back_button, get_main_menu, create_post, clean_filename, calculate_title_similarity, notify_and_remove_invalid_channel
+from database.search import search_user_files
+from utils.channel_registry import channel_registry
+from features.backup import run_backup
+from features.fsub import forget_fsub_channel
+from utils.helpers import go_back_button, get_main_menu, notify_and_remove_invalid_channel
 
 logger = logging.getLogger(__name__)
 ACTIVE_BACKUP_TASKS = set()
+SEARCH_SESSIONS = OrderedDict()
+SEARCH_SESSION_LIMIT = 1000
 
 
 async def safe_edit_message(source, *args, **kwargs):
@@ -95,10 +103,10 @@ async def get_fsub_menu_parts(client, user_id):
     if fsub_ch:
         is_valid = await notify_and_remove_invalid_channel(client, user_id, fsub_ch, "FSub")
         if is_valid:
-            try:
-                chat = await client.get_chat(fsub_ch)
-                text += f"Current FSub Channel: **{chat.title}**"
-            except:
+            status = channel_registry.get(fsub_ch)
+            if status and status.title:
+                text += f"Current FSub Channel: **{status.title}**"
+            else:
                 text += f"Current FSub Channel ID: `{fsub_ch}`"
     else:
         text += "No FSub channel is set."
@@ -207,26 +215,41 @@ async def toggle_poster_handler(client, query):
     text, markup = await get_poster_menu_parts(user_id)
     await safe_edit_message(query, text=text, reply_markup=markup)
 
-@Client.on_callback_query(filters.regex(r"my_files_(\d+)"))
+def _file_list_text(client, files_list):
+    text = ""
+    for file in files_list:
+        deep_link = f"https://t.me/{client.me.username}?start=ownerget_{file['file_unique_id']}"
+        text += f"**File:** `{file['file_name']}`\n**Link:** [Click Here to Get File]({deep_link})\n\n"
+    return text
+
+def _page_nav_row(prefix, page, files_list, has_prev, has_next, cursor_of):
+    """Previous/Next buttons carrying the page number and an encoded keyset cursor."""
+    nav_row = []
+    if has_prev and files_list: nav_row.append(InlineKeyboardButton("⬅️ Previous", callback_data=f"{prefix}_{page-1}_p_{cursor_of(files_list[0])}"))
+    if has_next and files_list: nav_row.append(InlineKeyboardButton("Next ➡️", callback_data=f"{prefix}_{page+1}_n_{cursor_of(files_list[-1])}"))
+    return nav_row
+
+@Client.on_callback_query(filters.regex(r"^my_files_(\d+)(?:_([np])_([0-9a-f]{24}))?$"))
 async def my_files_handler(client, query):
     try:
         user_id = query.from_user.id
-        page = int(query.data.split("_")[-1])
-        total_files = await get_user_file_count(user_id)
+        page, direction, cursor = query.matches[0].groups()
+        page, backwards = int(page), direction == 'p'
+        cursor = ObjectId(cursor) if cursor else None
+        if cursor is None: page = 1
         files_per_page = 5
+        total_files = await get_user_file_count(user_id)
         text = f"**📂 Your Saved Files ({total_files} Total)**\n\n"
+        files_on_page, has_more = [], False
         if total_files == 0:
             text += "You have not saved any files yet."
         else:
-            files_on_page = await get_paginated_files(user_id, page, files_per_page)
+            files_on_page, has_more = await get_paginated_files(user_id, cursor, backwards, files_per_page)
             if not files_on_page: text += "No more files found on this page."
-            else:
-                for file in files_on_page:
-                    deep_link = f"https://t.me/{client.me.username}?start=ownerget_{file['file_unique_id']}"
-                    text += f"**File:** `{file['file_name']}`\n**Link:** [Click Here to Get File]({deep_link})\n\n"
-        buttons, nav_row = [], []
-        if page > 1: nav_row.append(InlineKeyboardButton("⬅️ Previous", callback_data=f"my_files_{page-1}"))
-        if total_files > page * files_per_page: nav_row.append(InlineKeyboardButton("Next ➡️", callback_data=f"my_files_{page+1}"))
+            else: text += _file_list_text(client, files_on_page)
+        has_prev, has_next = (has_more, True) if backwards else (page > 1, has_more)
+        buttons = []
+        nav_row = _page_nav_row("my_files", page, files_on_page, has_prev, has_next, lambda f: f['_id'])
         if nav_row: buttons.append(nav_row)
         buttons.append([InlineKeyboardButton("🔍 Search My Files", callback_data="search_my_files")])
         buttons.append([InlineKeyboardButton("« Go Back", callback_data=f"go_back_{user_id}")])
@@ -234,19 +257,28 @@ async def my_files_handler(client, query):
     except Exception:
         logger.exception("Error in my_files_handler"); await query.answer("Something went wrong.", show_alert=True)
 
-async def _format_and_send_search_results(client, query, user_id, search_query, page):
+def _save_search_session(search_query, total):
+    """Keeps the query and its match count server side; callback_data only carries a short token."""
+    token = secrets.token_hex(4)
+    SEARCH_SESSIONS[token] = {'query': search_query, 'total': total}
+    while len(SEARCH_SESSIONS) > SEARCH_SESSION_LIMIT:
+        SEARCH_SESSIONS.popitem(last=False)
+    return token
+
+async def _format_and_send_search_results(client, query, user_id, search_query, token=None, page=1, cursor=None, backwards=False):
     files_per_page = 5
-    files_list, total_files = await search_user_files(user_id, search_query, page, files_per_page)
+    if token is None:
+        files_list, has_more, total_files = await search_user_files(user_id, search_query, page_size=files_per_page, with_total=True)
+        token = _save_search_session(search_query, total_files)
+    else:
+        files_list, has_more, _ = await search_user_files(user_id, search_query, cursor, backwards, files_per_page)
+        total_files = SEARCH_SESSIONS[token]['total']
     text = f"**🔎 Search Results for `{search_query}` ({total_files} Found)**\n\n"
     if not files_list: text += "No files found for your query."
-    else:
-        for file in files_list:
-            deep_link = f"https://t.me/{client.me.username}?start=ownerget_{file['file_unique_id']}"
-            text += f"**File:** `{file['file_name']}`\n**Link:** [Click Here to Get File]({deep_link})\n\n"
-    buttons, nav_row = [], []
-    encoded_query = base64.urlsafe_b64encode(search_query.encode()).decode().strip("=")
-    if page > 1: nav_row.append(InlineKeyboardButton("⬅️ Previous", callback_data=f"search_results_{page-1}_{encoded_query}"))
-    if total_files > page * files_per_page: nav_row.append(InlineKeyboardButton("Next ➡️", callback_data=f"search_results_{page+1}_{encoded_query}"))
+    else: text += _file_list_text(client, files_list)
+    buttons = []
+    has_prev, has_next = (has_more, True) if backwards else (page > 1, has_more)
+    nav_row = _page_nav_row(f"sr_{token}", page, files_list, has_prev, has_next, lambda f: f"{f['score']}_{f['_id']}")
     if nav_row: buttons.append(nav_row)
     buttons.append([InlineKeyboardButton("📚 Back to Full List", callback_data="my_files_1")])
     buttons.append([InlineKeyboardButton("« Go Back to Settings", callback_data=f"go_back_{user_id}")])
@@ -259,19 +291,22 @@ async def search_my_files_prompt(client, query):
         prompt = await query.message.edit_text("**🔍 Search Your Files**\n\nPlease send the name of the file you want to find.", reply_markup=go_back_button(user_id))
         response = await client.listen(chat_id=user_id, timeout=300, filters=filters.text)
         await response.delete()
-        await _format_and_send_search_results(client, query, user_id, response.text, 1)
+        await _format_and_send_search_results(client, query, user_id, response.text)
     except asyncio.TimeoutError: await safe_edit_message(query, text="❗️ **Timeout:** Search cancelled.", reply_markup=go_back_button(user_id))
     except Exception as e:
         logger.exception("Error in search_my_files_prompt"); await safe_edit_message(query, text=f"An error occurred: {e}", reply_markup=go_back_button(user_id))
 
-@Client.on_callback_query(filters.regex(r"search_results_(\d+)_(.+)"))
+@Client.on_callback_query(filters.regex(r"^sr_([0-9a-f]{8})_(\d+)_([np])_(\d+)_([0-9a-f]{24})$"))
 async def search_results_paginator(client, query):
     try:
-        page = int(query.matches[0].group(1))
-        encoded_query = query.matches[0].group(2)
-        padding = 4 - (len(encoded_query) % 4)
-        search_query = base64.urlsafe_b64decode(encoded_query + "=" * padding).decode()
-        await _format_and_send_search_results(client, query, query.from_user.id, search_query, page)
+        token, page, direction, score, last_id = query.matches[0].groups()
+        session = SEARCH_SESSIONS.get(token)
+        if not session: return await query.answer("This search has expired. Please search again.", show_alert=True)
+        SEARCH_SESSIONS.move_to_end(token)
+        await _format_and_send_search_results(
+            client, query, query.from_user.id, session['query'], token,
+            int(page), (int(score), ObjectId(last_id)), direction == 'p'
+        )
     except Exception:
         logger.exception("Error during search pagination"); await safe_edit_message(query, text="An error occurred during pagination.")
 
@@ -281,59 +316,38 @@ async def backup_links_handler(client, query):
     post_channels = user.get('post_channels', [])
     if not post_channels: return await query.answer("You have not set any Post Channels yet.", show_alert=True)
     kb = []
-    for ch_id in post_channels:
-        try: kb.append([InlineKeyboardButton((await client.get_chat(ch_id)).title, callback_data=f"start_backup_{ch_id}")])
-        except: continue
+    statuses = await asyncio.gather(*(channel_registry.check(client, ch_id) for ch_id in post_channels))
+    for ch_id, status in zip(post_channels, statuses):
+        if status and status.accessible and status.title:
+            kb.append([InlineKeyboardButton(status.title, callback_data=f"start_backup_{ch_id}")])
     if not kb: return await query.answer("Could not access any of your Post Channels.", show_alert=True)
     kb.append([InlineKeyboardButton("« Go Back", callback_data=f"go_back_{query.from_user.id}")])
     await safe_edit_message(query, text="**🔄 Smart Backup**\n\nSelect a channel to back up your posts to.", reply_markup=InlineKeyboardMarkup(kb))
 
-@Client.on_callback_query(filters.regex(r"start_backup_-?\d+"))
+@Client.on_callback_query(filters.regex(r"^(start|resume|fresh)_backup_-?\d+$"))
 async def start_backup_process(client, query):
     user_id = query.from_user.id
     if user_id in ACTIVE_BACKUP_TASKS: return await query.answer("A backup process is already running.", show_alert=True)
-    channel_id = int(query.data.split("_")[-1])
+    action, channel_id = query.data.split("_")[0], int(query.data.split("_")[-1])
+    if action == "start" and await get_backup_checkpoint(user_id, channel_id):
+        # Adhoora backup mila: user khud chune ki wahi se chalu kare ya naye sire se
+        kb = [
+            [InlineKeyboardButton("♻️ Resume", callback_data=f"resume_backup_{channel_id}"), InlineKeyboardButton("🔁 Start Over", callback_data=f"fresh_backup_{channel_id}")],
+            [InlineKeyboardButton("« Go Back", callback_data="backup_links")]
+        ]
+        return await safe_edit_message(query, text="**🔄 Smart Backup**\n\nAn unfinished backup to this channel was found. Resume it, or start over and post everything again?", reply_markup=InlineKeyboardMarkup(kb))
     ACTIVE_BACKUP_TASKS.add(user_id)
+    cancel_markup = InlineKeyboardMarkup([[InlineKeyboardButton("❌ Cancel Backup", callback_data=f"cancel_backup_{user_id}")]])
+
+    async def update_status(text, cancellable):
+        await safe_edit_message(query, text=text, reply_markup=cancel_markup if cancellable else None)
+
     try:
-        await query.message.edit_text("⏳ `Step 1/3:` Fetching all your file records...")
-        all_file_docs = await (await get_all_user_files(user_id)).to_list(length=None)
-        if not all_file_docs:
+        result = await run_backup(client, user_id, channel_id, update_status, lambda: user_id not in ACTIVE_BACKUP_TASKS, fresh=action == "fresh")
+        if result == 'empty':
             return await safe_edit_message(query, text="You have no files to back up.", reply_markup=go_back_button(user_id))
-        await query.message.edit_text("⏳ `Step 2/3:` Intelligently grouping files by similarity...")
-        batches = []
-        for doc in all_file_docs:
-            if not doc.get('file_name'): continue
-            doc_title, _, _ = clean_filename(doc['file_name'])
-            if not doc_title: continue
-            added_to_existing_batch = False
-            for batch in batches:
-                batch_title, _, _ = clean_filename(batch[0]['file_name'])
-                if calculate_title_similarity(doc_title, batch_title) > 0.85:
-                    batch.append(doc)
-                    added_to_existing_batch = True
-                    break
-            if not added_to_existing_batch:
-                batches.append([doc])
-        total_batches = len(batches)
-        await safe_edit_message(query, text=f"✅ `Step 2/3:` Found **{total_batches}** unique posts to create. Starting backup...", reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("❌ Cancel Backup", callback_data=f"cancel_backup_{user_id}")]]))
-        for i, file_docs_batch in enumerate(batches):
-            if user_id not in ACTIVE_BACKUP_TASKS:
-                await safe_edit_message(query, text="❌ Backup cancelled by user.", reply_markup=go_back_button(user_id)); return
-            try:
-                message_ids = [int(d['raw_link'].split('/')[-1]) for d in file_docs_batch]
-                source_chat_id = int("-100" + file_docs_batch[0]['raw_link'].split('/')[-2])
-                file_messages = await client.get_messages(source_chat_id, message_ids)
-                posts_to_send = await create_post(client, user_id, file_messages)
-                for post in posts_to_send:
-                    poster, caption, footer = post
-                    if poster: await client.send_photo(channel_id, photo=poster, caption=caption, reply_markup=footer)
-                    else: await client.send_message(channel_id, caption, reply_markup=footer, disable_web_page_preview=True)
-                    await asyncio.sleep(3)
-                progress_text = f"🔄 `Step 3/3:` Progress: {i + 1} / {total_batches} batches processed."
-                await safe_edit_message(query, text=progress_text, reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("❌ Cancel Backup", callback_data=f"cancel_backup_{user_id}")]]))
-            except Exception as e:
-                logger.exception(f"Failed to post batch during backup for user {user_id}.")
-                await client.send_message(user_id, f"Failed to back up a batch. Error: {e}")
+        if result == 'cancelled':
+            return await safe_edit_message(query, text="❌ Backup cancelled by user. Start it again later to resume where it stopped.", reply_markup=go_back_button(user_id))
         await query.message.delete()
         await client.send_message(user_id, "✅ **Backup Complete!**", reply_markup=go_back_button(user_id))
     except Exception as e:
@@ -394,19 +408,16 @@ async def manage_channels_handler(client, query):
     text = f"**Manage Your {ch_type_name} Channels**\n\n"
     buttons = []
     
-    valid_channels = []
-    if channels:
-        for ch_id in channels:
-            if await notify_and_remove_invalid_channel(client, user_id, ch_id, ch_type_name):
-                valid_channels.append(ch_id)
+    checks = await asyncio.gather(*(notify_and_remove_invalid_channel(client, user_id, ch_id, ch_type_name) for ch_id in channels))
+    valid_channels = [ch_id for ch_id, is_valid in zip(channels, checks) if is_valid]
     
     if valid_channels:
         text += "Here are your connected channels. Click to remove."
         for ch_id in valid_channels:
-            try:
-                chat = await client.get_chat(ch_id)
-                buttons.append([InlineKeyboardButton(f"❌ {chat.title}", callback_data=f"rm_{ch_type}_{ch_id}")])
-            except:
+            status = channel_registry.get(ch_id)
+            if status and status.title:
+                buttons.append([InlineKeyboardButton(f"❌ {status.title}", callback_data=f"rm_{ch_type}_{ch_id}")])
+            else:
                 buttons.append([InlineKeyboardButton(f"❌ Unavailable ({ch_id})", callback_data=f"rm_{ch_type}_{ch_id}")])
     else:
         text += "You haven't added any channels yet."
@@ -486,6 +497,8 @@ async def set_other_links_handler(client, query):
         if action == "fsub":
             if not response.forward_from_chat: return await response.reply("Not a valid forwarded message.", reply_markup=go_back_button(user_id))
             value = response.forward_from_chat.id
+            # Bot shayad dobara add hua ho: purana admin status aur invite link na chale
+            await forget_fsub_channel(value)
         else: # action == "download"
             value = response.text.strip()
             if not value.startswith(("http://", "https://")):
@@ -1,12 +1,13 @@
 import logging
-import re  # <-- Naya zaroori import
 from pyrogram import Client, filters, enums
-from pyrogram.errors import UserNotParticipant, MessageNotModified, ChatAdminRequired, ChannelInvalid, PeerIdInvalid, ChannelPrivate
+from pyrogram.errors import MessageNotModified
 from pyrogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 from config import Config
-from database.db import add_user, get_file_by_unique_id, get_user, get_owner_db_channel, is_user_verified, update_user, claim_verification_for_file
+from database.db import add_user, get_delivery_record, get_user, is_user_verified, update_user, claim_verification_for_file
 from utils.helpers import get_main_menu
+from utils.request_guard import request_guard, DUPLICATE, RATE_LIMITED
 from features.shortener import get_shortlink
+from features.fsub import is_fsub_member, get_fsub_link, forget_fsub_channel, FSubChannelError
 
 logger = logging.getLogger(__name__)
 
@@ -37,23 +38,20 @@ async def handle_private_file(client, message):
         logger.exception("Error in handle_private_file")
         await processing_msg.edit_text(f"An error occurred: {e}")
 
-async def send_file(client, user_id, file_unique_id):
+async def send_file(client, user_id, file_unique_id, record=None):
     try:
-        file_data = await get_file_by_unique_id(file_unique_id)
-        if not file_data:
+        # Delivery record cache se aata hai; warm cache par koi DB call nahi
+        record = record or await get_delivery_record(file_unique_id)
+        if not record:
             return await client.send_message(user_id, "Sorry, this file is no longer available.")
-        
-        # File ke owner ki settings nikalenge
-        owner_id = file_data['owner_id']
-        owner_settings = await get_user(owner_id)
 
-        storage_channel_id = await get_owner_db_channel()
+        storage_channel_id = record['storage_chat_id'] or client.owner_db_channel_id
         if not storage_channel_id:
             logger.error("Owner DB Channel not set, cannot send file.")
             return await client.send_message(user_id, "A configuration error occurred on the bot.")
 
-        download_link = f"http://{client.vps_ip}:{client.vps_port}/download/{file_data['stream_id']}"
-        watch_link = f"http://{client.vps_ip}:{client.vps_port}/watch/{file_data['stream_id']}"
+        download_link = f"http://{client.vps_ip}:{client.vps_port}/download/{record['stream_id']}"
+        watch_link = f"http://{client.vps_ip}:{client.vps_port}/watch/{record['stream_id']}"
         
         buttons = [
             [InlineKeyboardButton("📥 Download", url=download_link)],
@@ -61,35 +59,19 @@ async def send_file(client, user_id, file_unique_id):
         ]
         keyboard = InlineKeyboardMarkup(buttons)
         
-        # ================================================================= #
-        # VVVVVV YAHAN PAR HYPERLINK AUR PROMOTION FIX KIYA GAYA HAI VVVVVV #
-        # ================================================================= #
-
-        # Step 1: File ka original naam lein
-        file_name_raw = file_data.get('file_name', 'N/A')
-        
-        # Step 2: Naam se @username/@channelname jaise promotions hatayein
-        file_name_cleaned = re.sub(r'@\S+', '', file_name_raw).strip()
-        
-        filename_part = ""
-        filename_url = owner_settings.get("filename_url") if owner_settings else None
-
-        # Step 3: Check karein ki user ne custom URL set kiya hai ya nahi
-        if filename_url:
-            # Agar URL hai, to hyperlink banayein
-            filename_part = f"[{file_name_cleaned}]({filename_url})"
+        # Owner ne custom URL set kiya hai to naam hyperlink banega, warna monospaced text
+        if record['filename_url']:
+            filename_part = f"[{record['clean_name']}]({record['filename_url']})"
         else:
-            # Agar URL nahi hai, to normal monospaced text banayein
-            filename_part = f"`{file_name_cleaned}`"
+            filename_part = f"`{record['clean_name']}`"
 
-        # Step 4: Naye filename_part ke saath final caption banayein
         caption = f"✅ **Here is your file!**\n\n{filename_part}"
 
         await client.copy_message(
             chat_id=user_id,
             from_chat_id=storage_channel_id,
-            message_id=file_data['file_id'],
-            caption=caption, # Yahan naya caption istemal hoga
+            message_id=record['file_id'],
+            caption=caption,
             reply_markup=keyboard,
             parse_mode=enums.ParseMode.MARKDOWN # Hyperlink ke liye zaroori
         )
@@ -102,27 +84,32 @@ async def send_file(client, user_id, file_unique_id):
 async def start_command(client, message):
     if message.from_user.is_bot: return
     user_id = message.from_user.id
+    payload = message.command[1] if len(message.command) > 1 else ""
+    # Ek hi link baar baar dabane par sirf pehli request chalti hai; duplicate chup-chaap drop
+    status = await request_guard.run(user_id, payload, lambda: _process_start(client, message, user_id, payload))
+    if status == RATE_LIMITED and request_guard.claim_limit_notice(user_id):
+        await message.reply_text("⏳ Too many requests. Please wait a few seconds and try again.")
+
+
+async def _process_start(client, message, user_id, payload):
     await add_user(user_id)
     
-    if len(message.command) > 1:
-        payload = message.command[1]
+    if payload:
         try:
             if payload.startswith("finalget_"):
                 _, file_unique_id = payload.split("_", 1)
                 
-                file_data = await get_file_by_unique_id(file_unique_id)
-                if file_data:
-                    owner_id = file_data['owner_id']
+                record = await get_delivery_record(file_unique_id)
+                if record:
+                    owner_id = record['owner_id']
                     owner_settings = await get_user(owner_id)
                     
-                    if owner_settings and owner_settings.get('shortener_mode') == '12_hour':
-                        was_already_verified = await is_user_verified(user_id, owner_id)
-                        claim_successful = await claim_verification_for_file(file_unique_id, user_id, owner_id)
-                        
-                        if claim_successful and not was_already_verified:
+                    # Pehle se verified user ke liye koi DB call nahi (cache se), claim sirf naye verification par
+                    if owner_settings and owner_settings.get('shortener_mode') == '12_hour' and not await is_user_verified(user_id, owner_id):
+                        if await claim_verification_for_file(file_unique_id, user_id, owner_id):
                             await client.send_message(user_id, "✅ **Verification Successful!**\n\nYou can now get direct links from this user's channels for the next 12 hours.")
                 
-                await send_file(client, user_id, file_unique_id)
+                await send_file(client, user_id, file_unique_id, record)
 
             elif payload.startswith("ownerget_"):
                 _, file_unique_id = payload.split("_", 1)
@@ -154,30 +141,28 @@ async def start_command(client, message):
         await message.reply_text(text, reply_markup=keyboard)
 
 
-async def handle_public_file_request(client, message, user_id, payload):
+async def handle_public_file_request(client, message, user_id, payload, recheck=False):
     file_unique_id = payload.split("_", 1)[1]
-    file_data = await get_file_by_unique_id(file_unique_id)
-    if not file_data: return await message.reply_text("File not found or link has expired.")
+    # Delivery record yahin warm ho jata hai, taaki finalget_ click par DB call na lage
+    record = await get_delivery_record(file_unique_id)
+    if not record: return await message.reply_text("File not found or link has expired.")
     
-    owner_id = file_data['owner_id']
+    owner_id = record['owner_id']
     owner_settings = await get_user(owner_id)
     
     fsub_channel = owner_settings.get('fsub_channel')
     if fsub_channel:
         try:
-            await client.get_chat_member(chat_id=fsub_channel, user_id="me")
-            try:
-                await client.get_chat_member(chat_id=fsub_channel, user_id=user_id)
-            except UserNotParticipant:
-                try: invite_link = await client.export_chat_invite_link(fsub_channel)
-                except Exception: invite_link = None
-                buttons = [[InlineKeyboardButton("📢 Join Channel", url=invite_link)], [InlineKeyboardButton("🔄 Retry", callback_data=f"retry_{payload}")]]
+            if not await is_fsub_member(client, fsub_channel, user_id, recheck=recheck):
+                invite_link = await get_fsub_link(client, fsub_channel)
+                buttons = [[InlineKeyboardButton("📢 Join Channel", url=invite_link)]] if invite_link else []
+                buttons.append([InlineKeyboardButton("🔄 Retry", callback_data=f"retry_{payload}")])
                 return await message.reply_text("You must join the channel to continue.", reply_markup=InlineKeyboardMarkup(buttons))
-        except (UserNotParticipant, ChatAdminRequired, ChannelInvalid, PeerIdInvalid, ChannelPrivate) as e:
+        except FSubChannelError as e:
             logger.error(f"FSub channel error for owner {owner_id} (Channel: {fsub_channel}): {e}")
+            await forget_fsub_channel(fsub_channel)
             await client.send_message(chat_id=owner_id, text=f"⚠️ **FSub Channel Error**\n\nYour FSub channel (`{fsub_channel}`) is no longer accessible.")
             await update_user(owner_id, "fsub_channel", None)
-            pass
     
     shortener_enabled = owner_settings.get('shortener_enabled', True)
     shortener_mode = owner_settings.get('shortener_mode', 'each_time')
@@ -210,8 +195,14 @@ async def handle_public_file_request(client, message, user_id, payload):
 
 @Client.on_callback_query(filters.regex(r"^retry_"))
 async def retry_handler(client, query):
-    await query.message.delete()
-    await handle_public_file_request(client, query.message, query.from_user.id, query.data.split("_", 1)[1])
+    payload = query.data.split("_", 1)[1]
+    async def retry():
+        await query.message.delete()
+        await handle_public_file_request(client, query.message, query.from_user.id, payload, recheck=True)
+    # Same key as the get_ deep link, so a link tap and a Retry tap coalesce too
+    status = await request_guard.run(query.from_user.id, payload, retry)
+    if status == RATE_LIMITED: await query.answer("Too many requests. Please wait a few seconds.")
+    elif status == DUPLICATE: await query.answer()
 
 @Client.on_callback_query(filters.regex(r"go_back_"))
 async def go_back_callback(client, query):
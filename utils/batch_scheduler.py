@@ -0,0 +1,120 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DELAY = 7
+MIN_DELAY = 3
+MAX_DELAY = 20
+MAX_BATCH_AGE = 90
+GAP_MULTIPLIER = 2.5
+GAP_SMOOTHING = 0.3
+
+
+class BatchScheduler:
+    """
+    Heap based deadline scheduler for open upload batches.
+
+    Every (owner, key) pair has at most one live deadline. Re-arming a batch just
+    pushes a new heap entry; stale entries are skipped lazily when they surface,
+    so thousands of open batches cost one sleeping task instead of one timer each.
+    The debounce window follows each owner's smoothed inter-arrival gap and a
+    batch is always flushed once it is MAX_BATCH_AGE seconds old.
+    """
+
+    def __init__(self, callback, default_delay=DEFAULT_DELAY, min_delay=MIN_DELAY,
+                 max_delay=MAX_DELAY, max_age=MAX_BATCH_AGE):
+        self.callback = callback
+        self.default_delay = default_delay
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.max_age = max_age
+        self._heap = []
+        self._entries = {}       # (owner_id, key) -> (deadline, seq, first_seen)
+        self._last_arrival = {}  # owner_id -> monotonic time of last file
+        self._avg_gap = {}       # owner_id -> smoothed inter-arrival gap
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    def start(self):
+        if not self._task:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def _observe_arrival(self, owner_id, now):
+        last = self._last_arrival.get(owner_id)
+        self._last_arrival[owner_id] = now
+        if last is None:
+            return
+        gap = now - last
+        # Ek lamba pause naye upload session jaisa hai, use average mein mat milao
+        if gap > self.max_delay:
+            self._avg_gap.pop(owner_id, None)
+            return
+        prev = self._avg_gap.get(owner_id)
+        self._avg_gap[owner_id] = gap if prev is None else prev + GAP_SMOOTHING * (gap - prev)
+
+    def delay_for(self, owner_id):
+        avg_gap = self._avg_gap.get(owner_id)
+        if avg_gap is None:
+            return self.default_delay
+        return min(self.max_delay, max(self.min_delay, avg_gap * GAP_MULTIPLIER))
+
+    def touch(self, owner_id, key):
+        """Registers a new file for a batch and (re)arms its flush deadline."""
+        now = time.monotonic()
+        self._observe_arrival(owner_id, now)
+        entry = self._entries.get((owner_id, key))
+        first_seen = entry[2] if entry else now
+        deadline = min(now + self.delay_for(owner_id), first_seen + self.max_age)
+        seq = next(self._seq)
+        self._entries[(owner_id, key)] = (deadline, seq, first_seen)
+        heapq.heappush(self._heap, (deadline, seq, owner_id, key))
+        if self._heap[0][1] == seq:
+            self._wakeup.set()
+
+    def cancel(self, owner_id, key):
+        self._entries.pop((owner_id, key), None)
+
+    def __len__(self):
+        return len(self._entries)
+
+    async def _run(self):
+        logger.info("Batch Scheduler started.")
+        while True:
+            try:
+                self._wakeup.clear()
+                if not self._heap:
+                    await self._wakeup.wait()
+                    continue
+                deadline, seq, owner_id, key = self._heap[0]
+                entry = self._entries.get((owner_id, key))
+                if not entry or entry[1] != seq:
+                    heapq.heappop(self._heap)
+                    continue
+                timeout = deadline - time.monotonic()
+                if timeout > 0:
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                heapq.heappop(self._heap)
+                del self._entries[(owner_id, key)]
+                asyncio.create_task(self.callback(owner_id, key))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.exception(f"Error in batch scheduler loop: {e}")
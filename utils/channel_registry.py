@@ -0,0 +1,102 @@
+import asyncio
+import logging
+import time
+from pyrogram.errors import UserNotParticipant, ChatAdminRequired, ChannelInvalid, PeerIdInvalid, ChannelPrivate
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_TTL = 30 * 60
+REFRESH_INTERVAL = 5 * 60
+IDLE_EXPIRY = 24 * 60 * 60
+ACCESS_ERRORS = (UserNotParticipant, ChatAdminRequired, ChannelInvalid, PeerIdInvalid, ChannelPrivate)
+
+
+class ChannelStatus:
+    __slots__ = ('accessible', 'title', 'last_checked', 'last_used')
+
+    def __init__(self, accessible, title, last_checked):
+        self.accessible = accessible
+        self.title = title
+        self.last_checked = last_checked
+        self.last_used = last_checked
+
+
+class ChannelRegistry:
+    """
+    In-memory channel id -> (accessible, title, last_checked) registry.
+
+    Lookups are served from memory while an entry is younger than the TTL; a
+    background task revalidates entries before they expire so UI renders and
+    publishes normally never wait on get_chat_member.
+    """
+
+    def __init__(self, ttl=CHANNEL_TTL):
+        self.ttl = ttl
+        self._entries = {}
+        self._probes = {}
+
+    def get(self, channel_id):
+        return self._entries.get(channel_id)
+
+    def invalidate(self, channel_id):
+        self._entries.pop(channel_id, None)
+
+    async def _probe(self, client, channel_id):
+        try:
+            await client.get_chat_member(channel_id, "me")
+            accessible = True
+        except ACCESS_ERRORS:
+            accessible = False
+        previous = self._entries.get(channel_id)
+        title = previous.title if previous else None
+        if not title:
+            try:
+                title = (await client.get_chat(channel_id)).title
+            except Exception:
+                title = None
+        status = ChannelStatus(accessible, title, time.monotonic())
+        if previous: status.last_used = previous.last_used
+        self._entries[channel_id] = status
+        return status
+
+    async def check(self, client, channel_id, force=False):
+        """
+        Returns the ChannelStatus for a channel, probing Telegram only when the cached
+        entry is missing or stale. Returns None if the probe failed for an unexpected reason.
+        """
+        status = self._entries.get(channel_id)
+        if status and not force and time.monotonic() - status.last_checked < self.ttl:
+            status.last_used = time.monotonic()
+            return status
+        # Ek channel ka ek hi probe: saath aaye callers usi ka result share karte hain
+        task = self._probes.get(channel_id)
+        if task is None:
+            task = asyncio.ensure_future(self._probe(client, channel_id))
+            self._probes[channel_id] = task
+            task.add_done_callback(lambda _: self._probes.pop(channel_id, None))
+        try:
+            status = await asyncio.shield(task)
+        except Exception as e:
+            logger.error(f"An unexpected error occurred while checking channel {channel_id}: {e}")
+            return None
+        status.last_used = time.monotonic()
+        return status
+
+    async def run_refresher(self, client, interval=REFRESH_INTERVAL):
+        logger.info("Channel Registry refresher started.")
+        while True:
+            await asyncio.sleep(interval)
+            now = time.monotonic()
+            for channel_id, status in list(self._entries.items()):
+                if now - status.last_used > IDLE_EXPIRY:
+                    self._entries.pop(channel_id, None)
+                    continue
+                # Expire hone se pehle hi dobara check kar lo
+                if now - status.last_checked > self.ttl - interval:
+                    try:
+                        await self._probe(client, channel_id)
+                    except Exception as e:
+                        logger.warning(f"Background revalidation failed for channel {channel_id}: {e}")
+
+
+channel_registry = ChannelRegistry()
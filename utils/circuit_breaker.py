@@ -0,0 +1,108 @@
+import time
+from collections import deque
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half-open"
+
+
+class CircuitBreaker:
+    """
+    Health of one outbound provider, from a rolling window of recent calls.
+
+    - closed: calls go through; once at least `min_calls` are in the window and the
+      error rate reaches `failure_rate`, the circuit opens.
+    - open: calls fail fast for `open_for` seconds (doubling on every failed probe,
+      up to `max_open_for`).
+    - half-open: the cooldown is over and one probe may run; a success closes the
+      circuit with a clean window, a failure opens it again.
+    """
+
+    def __init__(self, name, window=20, min_calls=5, failure_rate=0.5, open_for=60, max_open_for=600):
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.base_open_for = open_for
+        self.max_open_for = max_open_for
+        self.state = CLOSED
+        self.open_for = open_for
+        self.opened_at = 0.0
+        self.probing = False
+        self.total_calls = 0
+        self.total_failures = 0
+        self._outcomes = deque(maxlen=window)   # (ok, latency) of recent calls
+
+    def allow_request(self) -> bool:
+        """Whether a normal (non-probe) call may go through right now."""
+        return self.state == CLOSED
+
+    def probe_due(self) -> bool:
+        """True once per cooldown: moves an open circuit to half-open and claims the probe."""
+        if self.state == OPEN and time.monotonic() - self.opened_at >= self.open_for:
+            self.state = HALF_OPEN
+        if self.state != HALF_OPEN or self.probing: return False
+        self.probing = True
+        return True
+
+    def record(self, ok: bool, latency: float):
+        self.total_calls += 1
+        if not ok: self.total_failures += 1
+        if self.state == HALF_OPEN:
+            self.probing = False
+            if ok: self._close()
+            else: self._open(backoff=True)
+            self._outcomes.append((ok, latency))
+            return
+        self._outcomes.append((ok, latency))
+        if self.state == CLOSED and len(self._outcomes) >= self.min_calls and self.error_rate() >= self.failure_rate:
+            self._open()
+
+    def _open(self, backoff=False):
+        self.open_for = min(self.open_for * 2, self.max_open_for) if backoff else self.base_open_for
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+
+    def _close(self):
+        self.state = CLOSED
+        self.open_for = self.base_open_for
+        self._outcomes.clear()
+
+    def error_rate(self) -> float:
+        if not self._outcomes: return 0.0
+        return sum(1 for ok, _ in self._outcomes if not ok) / len(self._outcomes)
+
+    def latency_percentile(self, percentile: float):
+        latencies = sorted(latency for ok, latency in self._outcomes if ok)
+        if not latencies: return None
+        return latencies[min(len(latencies) - 1, int(len(latencies) * percentile))]
+
+    def suggested_timeout(self, default: float, floor: float = 2.0) -> float:
+        """A per-attempt timeout scaled to the provider's recent p95 latency, never above `default`."""
+        p95 = self.latency_percentile(0.95)
+        if p95 is None or len(self._outcomes) < self.min_calls: return default
+        return max(floor, min(default, p95 * 3))
+
+    def stats(self) -> dict:
+        p50, p95 = self.latency_percentile(0.5), self.latency_percentile(0.95)
+        return {
+            'state': self.state, 'calls': self.total_calls, 'failures': self.total_failures,
+            'error_rate': self.error_rate(), 'p50': p50, 'p95': p95,
+        }
+
+
+class BreakerRegistry:
+    """One CircuitBreaker per provider name, created on first use."""
+
+    def __init__(self, **breaker_options):
+        self._options = breaker_options
+        self._breakers = {}
+
+    def get(self, name) -> CircuitBreaker:
+        breaker = self._breakers.get(name)
+        if breaker is None:
+            breaker = self._breakers[name] = CircuitBreaker(name, **self._options)
+        return breaker
+
+    def __iter__(self):
+        return iter(list(self._breakers.values()))
+
+    def stats(self) -> dict:
+        return {name: breaker.stats() for name, breaker in self._breakers.items()}
@@ -0,0 +1,119 @@
+import asyncio
+import logging
+import math
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from rapidfuzz import process
+from rapidfuzz.fuzz import ratio
+from thefuzz.utils import full_process
+
+logger = logging.getLogger(__name__)
+
+SIMILARITY_THRESHOLD = 0.85
+INLINE_LIMIT = 2000
+PROGRESS_EVERY = 250
+
+_progress_counter = None
+
+
+def similarity_key(title: str) -> str:
+    """The string thefuzz.token_sort_ratio actually compares: processed, ascii-only, tokens sorted."""
+    return " ".join(sorted(full_process(title, force_ascii=True).split()))
+
+
+class TitleClusterer:
+    """
+    Greedy title grouping with the same result as comparing every title against the
+    head of every existing batch with calculate_title_similarity, but scalable:
+
+    - titles with the same similarity key always land in the same batch, so each
+      distinct key is scored only once;
+    - heads are bucketed by key length and only buckets that can reach the threshold
+      (ratio <= 200 * shorter / total) are scored;
+    - candidate buckets are scored in one rapidfuzz call each instead of a Python loop.
+    """
+
+    def __init__(self, threshold=SIMILARITY_THRESHOLD):
+        self.min_score = round(threshold * 100) + 1   # calculate_title_similarity > threshold
+        self.batch_count = 0
+        self._key_to_batch = {}
+        self._head_keys = {}     # key length -> [head key, ...] in creation order
+        self._head_batches = {}  # key length -> [batch index, ...]
+
+    def _length_range(self, length):
+        bound = self.min_score - 0.5
+        # Ek-ek length ki dheel taaki float rounding boundary wale heads ko na chhode
+        return math.ceil(length * bound / (200 - bound)) - 1, math.floor(length * (200 - bound) / bound) + 1
+
+    def assign(self, title: str) -> int:
+        key = similarity_key(title)
+        if not key:
+            # thefuzz khaali string ko 0 deta hai: aisi file kisi se match nahi karti, apna alag batch
+            self.batch_count += 1
+            return self.batch_count - 1
+        batch = self._key_to_batch.get(key)
+        if batch is not None:
+            return batch
+
+        lo, hi = self._length_range(len(key))
+        for length in range(lo, hi + 1):
+            head_keys = self._head_keys.get(length)
+            if not head_keys: continue
+            matches = process.extract(key, head_keys, scorer=ratio, processor=None,
+                                      score_cutoff=self.min_score - 1, limit=None)
+            for _, _, pos in matches:
+                candidate = self._head_batches[length][pos]
+                if (batch is None or candidate < batch) and int(round(ratio(key, head_keys[pos]))) >= self.min_score:
+                    batch = candidate
+
+        if batch is None:
+            batch = self.batch_count
+            self.batch_count += 1
+            self._head_keys.setdefault(len(key), []).append(key)
+            self._head_batches.setdefault(len(key), []).append(batch)
+        self._key_to_batch[key] = batch
+        return batch
+
+
+def _init_worker(counter):
+    global _progress_counter
+    _progress_counter = counter
+
+
+def group_titles(titles, threshold=SIMILARITY_THRESHOLD):
+    """Returns the batch index of every title; batch indexes follow first appearance."""
+    clusterer = TitleClusterer(threshold)
+    assignments = []
+    for i, title in enumerate(titles):
+        assignments.append(clusterer.assign(title))
+        if _progress_counter is not None and i % PROGRESS_EVERY == 0:
+            _progress_counter.value = i
+    return assignments
+
+
+async def group_titles_async(titles, on_progress=None, threshold=SIMILARITY_THRESHOLD, poll_interval=3):
+    """
+    Runs group_titles off the event loop. Large libraries go to a separate process
+    and `on_progress(done, total)` is awaited every `poll_interval` seconds.
+    """
+    titles = list(titles)
+    if len(titles) <= INLINE_LIMIT:
+        return await asyncio.to_thread(group_titles, titles, threshold)
+
+    ctx = multiprocessing.get_context("spawn")
+    counter = ctx.Value('i', 0, lock=False)
+    loop = asyncio.get_running_loop()
+    try:
+        with ProcessPoolExecutor(max_workers=1, mp_context=ctx, initializer=_init_worker, initargs=(counter,)) as pool:
+            future = loop.run_in_executor(pool, group_titles, titles, threshold)
+            while True:
+                done, _ = await asyncio.wait({future}, timeout=poll_interval)
+                if done:
+                    return future.result()
+                if on_progress:
+                    try: await on_progress(counter.value, len(titles))
+                    except Exception as e: logger.warning(f"Grouping progress callback failed: {e}")
+    except (BrokenProcessPool, OSError) as e:
+        logger.warning(f"Process pool unavailable for title grouping ({e}). Falling back to a thread.")
+        return await asyncio.to_thread(group_titles, titles, threshold)
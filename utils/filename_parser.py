@@ -0,0 +1,199 @@
+import re
+import logging
+from functools import lru_cache
+import PTN
+from PTN.patterns import patterns as PTN_PATTERNS, types as PTN_TYPES
+
+logger = logging.getLogger(__name__)
+
+PARSE_CACHE_SIZE = 8192
+
+# PTN ke saare patterns ek hi baar compile hote hain (PTN har call par string patterns se re-lookup karta hai)
+_PATTERNS = [
+    (key, re.compile(pattern if key in ('season', 'episode', 'website') else r'\b%s\b' % pattern, re.I))
+    for key, pattern in PTN_PATTERNS
+]
+_CODEC_RE = re.compile(PTN_PATTERNS[5][1], re.I)
+_QUALITY_RE = re.compile(PTN_PATTERNS[4][1])
+_EPISODE_NAME_RE = re.compile(r'[^ ]+ [^ ]+ .+')
+_ESCAPE_RE = re.compile(r'[\-\[\]{}()*+?.,\\\^$|#\s]')
+
+# Fast path: a pattern can only match if one of these substrings is in the lowercased
+# name, so patterns whose hints are all absent are skipped without running the regex.
+# Only used for ASCII names, where lowercasing matches re.I exactly.
+_PATTERN_HINTS = {
+    'year': ('19', '20'),
+    'quality': ('dtv', 'cam', 'rip', 'ts', 'web', 'bluray', 'dvdscr'),
+    'codec': ('xvid', '26'),
+    'audio': ('mp3', 'dd5', 'dual', 'line', 'dts', 'aac', 'ac3'),
+    'group': ('-',),
+    'extended': ('extended',),
+    'hardcoded': ('hc',),
+    'proper': ('proper',),
+    'repack': ('repack',),
+    'container': ('mkv', 'avi'),
+    'widescreen': ('ws',),
+    'website': ('[',),
+    'language': ('rus',),
+    'sbs': ('sbs',),
+}
+_PATTERNS = [(key, pattern, _PATTERN_HINTS.get(key)) for key, pattern in _PATTERNS]
+
+_TITLE_DASH_RE = re.compile(r'^ -')
+_TITLE_TAIL_RE = re.compile(r'([\[\(_]|- )$')
+_EXCESS_TRIM_RE = re.compile(r'(^[-\. ()]+)|([-\. ]+$)')
+_EXCESS_PUNCT_RE = re.compile(r'[\(\)\/]')
+_EXCESS_SPLIT_RE = re.compile(r'\.\.+| +')
+_TRAILING_UNDERSCORE_RE = re.compile(r'_+$')
+_DOT_UNDERSCORE_RE = re.compile(r'[\._]')
+
+_FALLBACK_EXT_RE = re.compile(r'\.[^.]*$')
+_FALLBACK_YEAR_RE = re.compile(r'\s*\(\d{4}\)\s*')
+_FALLBACK_BRACKET_RE = re.compile(r'\s*\[.*?\]\s*')
+_FALLBACK_SPLIT_RE = re.compile(r'\b(19|20)\d{2}\b|720p|1080p|4k|webrip|web-dl|bluray|hdrip', re.I)
+
+
+def _parse_uncached(name: str) -> dict:
+    """
+    Same algorithm and output as PTN.parse, with precompiled patterns and the
+    substring fast path instead of running all 18 regexes on every name.
+    """
+    parts = {}
+    excess_raw = name
+    group_raw = ''
+    start, end = 0, None
+    episode_map = None
+    clean_name = name.replace('_', ' ')
+    lowered = clean_name.lower() if clean_name.isascii() else None
+
+    def add_part(key, match, raw, clean):
+        nonlocal excess_raw, group_raw, start, end
+        parts[key] = clean
+        if match:
+            index = name.find(match[0])
+            if index == 0:
+                start = len(match[0])
+            elif end is None or index < end:
+                end = index
+        if key != 'excess':
+            if key == 'group':
+                group_raw = raw
+            if raw is not None:
+                excess_raw = excess_raw.replace(raw, '')
+
+    for key, pattern, hints in _PATTERNS:
+        if hints and lowered is not None and not any(hint in lowered for hint in hints):
+            continue
+        match = pattern.findall(clean_name)
+        if not match:
+            continue
+        if isinstance(match[0], tuple):
+            match = list(match[0])
+        raw_index, clean_index = (0, 1) if len(match) > 1 else (0, 0)
+
+        if PTN_TYPES.get(key) == 'boolean':
+            clean = True
+        else:
+            clean = match[clean_index]
+            if PTN_TYPES.get(key) == 'integer':
+                clean = int(clean)
+        if key == 'group':
+            if _CODEC_RE.search(clean) or _QUALITY_RE.search(clean):
+                continue
+            if _EPISODE_NAME_RE.match(clean):
+                key = 'episodeName'
+        if key == 'episode':
+            # PTN ka JS-style escape jaan-boojh kar waisa hi rakha gaya hai taaki output same rahe
+            sub_pattern = _ESCAPE_RE.sub('\\$&', match[raw_index])
+            episode_map = re.sub(sub_pattern, '{episode}', name)
+        add_part(key, match, match[raw_index], clean)
+
+    raw = name
+    if end is not None:
+        raw = raw[start:end].split('(')[0]
+    clean = _TITLE_DASH_RE.sub('', raw)
+    if clean.find(' ') == -1 and clean.find('.') != -1:
+        clean = clean.replace('.', ' ')
+    clean = clean.replace('_', ' ')
+    clean = _TITLE_TAIL_RE.sub('', clean).strip()
+    add_part('title', [], raw, clean)
+
+    clean = _EXCESS_TRIM_RE.sub('', excess_raw)
+    clean = _EXCESS_PUNCT_RE.sub(' ', clean)
+    clean = [item for item in _EXCESS_SPLIT_RE.split(clean) if item and item != '-']
+    if clean:
+        group_pattern = clean[-1] + group_raw
+        if name.find(group_pattern) == len(name) - len(group_pattern):
+            add_part('group', [], None, clean.pop() + group_raw)
+        if episode_map is not None and clean:
+            if episode_map.find('{episode}' + _TRAILING_UNDERSCORE_RE.sub('', clean[0])) != -1:
+                episode_name = _DOT_UNDERSCORE_RE.sub(' ', clean.pop(0))
+                episode_name = _TRAILING_UNDERSCORE_RE.sub('', episode_name)
+                add_part('episodeName', [], None, episode_name.strip())
+    if clean:
+        add_part('excess', [], excess_raw, clean[0] if len(clean) == 1 else clean)
+    return parts
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def _parse_cached(name: str):
+    try:
+        parts = _parse_uncached(name)
+    except Exception:
+        logger.warning(f"Fast parser failed for '{name}'. Falling back to PTN.")
+        parts = PTN.parse(name)
+    return tuple((key, tuple(value) if isinstance(value, list) else value) for key, value in parts.items())
+
+
+def parse(name: str) -> dict:
+    """Drop-in, memoized replacement for PTN.parse. Returns a fresh dict on every call."""
+    return {key: list(value) if isinstance(value, tuple) else value for key, value in _parse_cached(name)}
+
+
+def _fallback_title(name: str):
+    fallback_name = _FALLBACK_EXT_RE.sub('', name)
+    fallback_name = fallback_name.replace('.', ' ').replace('_', ' ').strip()
+    fallback_name = _FALLBACK_YEAR_RE.sub('', fallback_name).strip()
+    fallback_name = _FALLBACK_BRACKET_RE.sub('', fallback_name).strip()
+
+    match = _FALLBACK_SPLIT_RE.split(fallback_name, maxsplit=1)
+    final_title = match[0].strip()
+    if not final_title:
+        final_title = fallback_name
+    return final_title, final_title, None
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def clean_filename(name: str):
+    """
+    The definitive 'champion pro' filename cleaner.
+    Returns (base_title, full_title, year); results are memoized per raw filename.
+    """
+    if not name:
+        return "Untitled", "Untitled", None
+
+    try:
+        processed_name = name.replace('.', ' ').replace('_', ' ')
+
+        parsed_info = _parse_cached(processed_name)
+        parsed_info = dict(parsed_info)
+        base_title = parsed_info.get('title')
+        year = str(parsed_info.get('year')) if parsed_info.get('year') else None
+
+        if not base_title:
+            raise ValueError("PTN did not find a title, triggering fallback.")
+
+        if 'season' in parsed_info and 'episode' in parsed_info:
+            season = parsed_info.get('season')
+            episode = parsed_info.get('episode')
+            full_title = f"{base_title} S{str(season).zfill(2)}E{str(episode).zfill(2)}"
+            episode_name = parsed_info.get('episodeName')
+            if episode_name:
+                full_title = f"{full_title} - {episode_name}"
+            return base_title.strip(), full_title.strip(), year
+
+        return base_title.strip(), base_title.strip(), year
+
+    except Exception:
+        logger.warning(f"PTN failed for '{name}'. Using the robust regex fallback.")
+        return _fallback_title(name)
@@ -1,87 +1,97 @@
 import re
 import base64
 import logging
-import PTN
 from pyrogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-from pyrogram.errors import UserNotParticipant, ChatAdminRequired, ChannelInvalid, PeerIdInvalid, ChannelPrivate
 from config import Config
 from database.db import get_user, remove_from_list
 from features.poster import get_poster
+from utils.channel_registry import channel_registry
+from utils.filename_parser import clean_filename, parse as parse_filename
 from thefuzz import fuzz
 
 logger = logging.getLogger(__name__)
 
 FILES_PER_POST = 20
+_MENTION_RE = re.compile(r'@\S+')
+_JOIN_US_RE = re.compile(r'Join Us On Telegram', re.IGNORECASE)
 
 
-def clean_filename(name: str):
+def strip_promotions(text: str) -> str:
+    text = _MENTION_RE.sub('', text)
+    text = _JOIN_US_RE.sub('', text)
+    return text.strip()
+
+
+TAG_FIELDS = ('resolution', 'quality', 'audio', 'codec', 'group')
+
+
+def parse_file_info(file_name: str) -> dict:
     """
-    The definitive 'champion pro' filename cleaner.
+    Parses a filename once into the structured metadata stored on file documents
+    (`parsed` sub-document) and on in-memory batch records.
     """
-    if not name:
-        return "Untitled", "Untitled", None
+    base_title, full_title, year = clean_filename(file_name)
+    tag_info = parse_filename(file_name) if file_name else {}
+    info = {
+        'title': base_title, 'full_title': full_title, 'year': year,
+        'season': tag_info.get('season'), 'episode': tag_info.get('episode'),
+        'title_key': strip_promotions(base_title).lower()
+    }
+    for field in TAG_FIELDS:
+        info[field] = tag_info.get(field)
+    return info
 
-    try:
-        processed_name = name.replace('.', ' ').replace('_', ' ')
-        
-        parsed_info = PTN.parse(processed_name)
-        base_title = parsed_info.get('title')
-        year = str(parsed_info.get('year')) if parsed_info.get('year') else None
-
-        if not base_title:
-            raise ValueError("PTN did not find a title, triggering fallback.")
-
-        if 'season' in parsed_info and 'episode' in parsed_info:
-            season = parsed_info.get('season')
-            episode = parsed_info.get('episode')
-            full_title = f"{base_title} S{str(season).zfill(2)}E{str(episode).zfill(2)}"
-            episode_name = parsed_info.get('episodeName')
-            if episode_name:
-                full_title = f"{full_title} - {episode_name}"
-            return base_title.strip(), full_title.strip(), year
-
-        return base_title.strip(), base_title.strip(), year
-
-    except Exception:
-        logger.warning(f"PTN failed for '{name}'. Using the robust regex fallback.")
-        
-        fallback_name = re.sub(r'\.[^.]*$', '', name)
-        fallback_name = fallback_name.replace('.', ' ').replace('_', ' ').strip()
-        fallback_name = re.sub(r'\s*\(\d{4}\)\s*', '', fallback_name).strip()
-        fallback_name = re.sub(r'\s*\[.*?\]\s*', '', fallback_name).strip()
-
-        match = re.split(r'\b(19|20)\d{2}\b|720p|1080p|4k|webrip|web-dl|bluray|hdrip', fallback_name, maxsplit=1, flags=re.I)
-        final_title = match[0].strip()
-        
-        if not final_title:
-            final_title = fallback_name
 
-        return final_title, final_title, None
+def get_doc_file_info(doc: dict) -> dict:
+    """Returns the stored parsed info of a file document, parsing legacy documents on the fly."""
+    return doc.get('parsed') or parse_file_info(doc.get('file_name'))
 
 
-async def create_post(client, user_id, messages):
+class BatchFile:
+    """
+    Compact per-file record kept in open batches instead of the full pyrogram Message.
+    Built from the info parsed at ingest, so post building does no regex work.
+    """
+    __slots__ = ('file_unique_id', 'file_name', 'file_size', 'base_title', 'full_title', 'year', 'tags', 'title_key')
+
+    def __init__(self, file_unique_id, file_name, file_size=None, info=None):
+        self.file_unique_id = file_unique_id
+        self.file_name = file_name or ""
+        self.file_size = file_size
+        info = info or parse_file_info(self.file_name)
+        self.base_title = info['title']
+        self.full_title = info['full_title']
+        self.year = info['year']
+        self.tags = " | ".join(str(info[field]) for field in TAG_FIELDS if info.get(field))
+        self.title_key = info['title_key']
+
+    @classmethod
+    def from_message(cls, message, info=None):
+        media = getattr(message, message.media.value, None) if message and message.media else None
+        if not media: return None
+        return cls(media.file_unique_id, getattr(media, 'file_name', None), getattr(media, 'file_size', None), info)
+
+    @classmethod
+    def from_doc(cls, doc, info=None):
+        return cls(doc['file_unique_id'], doc.get('file_name'), doc.get('file_size'), info or get_doc_file_info(doc))
+
+
+async def create_post(client, user_id, files):
     """
     Creates a professionally designed post with wrapped title and footer line.
+    `files` is a list of BatchFile records.
     """
     user = await get_user(user_id)
-    if not user: return []
-    first_media_obj = getattr(messages[0], messages[0].media.value, None)
-    if not first_media_obj: return []
+    if not user or not files: return []
 
-    primary_base_title, _, year = clean_filename(first_media_obj.file_name)
-    
-    cleaned_primary_title = re.sub(r'@\S+', '', primary_base_title)
-    cleaned_primary_title = re.sub(r'Join Us On Telegram', '', cleaned_primary_title, flags=re.IGNORECASE)
-    cleaned_primary_title = cleaned_primary_title.strip()
-
-    def similarity_sorter(msg):
-        media_obj = getattr(msg, msg.media.value, None)
-        if not media_obj: return (1.0, "")
-        base, _, _ = clean_filename(media_obj.file_name)
-        similarity_score = 1.0 - calculate_title_similarity(cleaned_primary_title, base)
-        natural_key = natural_sort_key(media_obj.file_name)
+    cleaned_primary_title = strip_promotions(files[0].base_title)
+    year = files[0].year
+
+    def similarity_sorter(record):
+        similarity_score = 1.0 - calculate_title_similarity(cleaned_primary_title, record.base_title)
+        natural_key = natural_sort_key(record.file_name)
         return (similarity_score, natural_key)
-    messages.sort(key=similarity_sorter)
+    files.sort(key=similarity_sorter)
     
     base_caption_header = f"🎬 **{cleaned_primary_title} {f'({year})' if year else ''}**"
     
@@ -96,35 +106,19 @@ async def create_post(client, user_id, messages):
     header_line = "▰▱▰▱▰▱▰▱▰▱▰▱▰▱▰▱"
     footer_line = "•·•·•·•·•·•·•·•·•·••·•·•·•·•·•·•·•"
 
-    posts, total = [], len(messages)
+    posts, total = [], len(files)
     num_posts = (total + FILES_PER_POST - 1) // FILES_PER_POST
     for i in range(num_posts):
-        chunk = messages[i*FILES_PER_POST:(i+1)*FILES_PER_POST]
+        chunk = files[i*FILES_PER_POST:(i+1)*FILES_PER_POST]
         header = f"{base_caption_header} (Part {i+1}/{num_posts})" if num_posts > 1 else base_caption_header
         links = []
-        for m in chunk:
-            media = getattr(m, m.media.value, None)
-            if not media: continue
-            
-            _, full_cleaned_label, _ = clean_filename(media.file_name)
-            
-            label_no_mentions = re.sub(r'@\S+', '', full_cleaned_label)
-            label_no_mentions = re.sub(r'Join Us On Telegram', '', label_no_mentions, flags=re.IGNORECASE)
-            label_no_mentions = label_no_mentions.strip()
-
-            parsed_info = PTN.parse(media.file_name)
-            extra_tags = [
-                parsed_info.get('resolution'),
-                parsed_info.get('quality'),
-                parsed_info.get('audio'),
-                parsed_info.get('codec'),
-                parsed_info.get('group')
-            ]
-            filtered_text = " | ".join(tag for tag in extra_tags if tag)
-
-            link = f"http://{Config.VPS_IP}:{Config.VPS_PORT}/get/{media.file_unique_id}"
+        for record in chunk:
+            label_no_mentions = strip_promotions(record.full_title)
+            filtered_text = record.tags
+
+            link = f"http://{Config.VPS_IP}:{Config.VPS_PORT}/get/{record.file_unique_id}"
             
-            file_entry = f"📁 `{label_no_mentions or media.file_name}`"
+            file_entry = f"📁 `{label_no_mentions or record.file_name}`"
             
             if filtered_text:
                 file_entry += f"\n   `{filtered_text}`"
@@ -142,12 +136,6 @@ async def create_post(client, user_id, messages):
     return posts
 
 
-def get_title_key(filename: str) -> str:
-    base_title, _, _ = clean_filename(filename)
-    cleaned_base_title = re.sub(r'@\S+', '', base_title)
-    cleaned_base_title = re.sub(r'Join Us On Telegram', '', cleaned_base_title, flags=re.IGNORECASE)
-    return cleaned_base_title.lower().strip()
-
 async def get_main_menu(user_id):
     user_settings = await get_user(user_id)
     if not user_settings:
@@ -182,31 +170,25 @@ async def get_main_menu(user_id):
 # ================================================================= #
 
 async def notify_and_remove_invalid_channel(client, user_id, channel_id, channel_type):
+    status = await channel_registry.check(client, channel_id)
+    if status is None: return False
+    if status.accessible: return True
+
+    channel_name = f"**{status.title}** (`{channel_id}`)" if status.title else f"`{channel_id}`"
+    error_text = (
+        f"⚠️ **Channel Inaccessible**\n\n"
+        f"Your {channel_type.title()} Channel {channel_name} is no longer accessible. "
+        f"This channel has been automatically removed from your settings."
+    )
     try:
-        await client.get_chat_member(channel_id, "me")
-        return True
-    except (UserNotParticipant, ChatAdminRequired, ChannelInvalid, PeerIdInvalid, ChannelPrivate):
-        channel_name = f"`{channel_id}`"
-        try:
-            chat = await client.get_chat(channel_id)
-            channel_name = f"**{chat.title}** (`{channel_id}`)"
-        except Exception:
-            pass
-        error_text = (
-            f"⚠️ **Channel Inaccessible**\n\n"
-            f"Your {channel_type.title()} Channel {channel_name} is no longer accessible. "
-            f"This channel has been automatically removed from your settings."
-        )
-        try:
-            await client.send_message(user_id, error_text, parse_mode='md')
-            db_key = f"{channel_type.lower()}_channels"
-            await remove_from_list(user_id, db_key, channel_id)
-        except Exception as notify_error:
-            logger.error(f"Failed to notify or remove channel for user {user_id}. Error: {notify_error}")
-        return False
-    except Exception as e:
-        logger.error(f"An unexpected error occurred while checking channel {channel_id}: {e}")
-        return False
+        await client.send_message(user_id, error_text, parse_mode='md')
+        db_key = f"{channel_type.lower()}_channels"
+        await remove_from_list(user_id, db_key, channel_id)
+    except Exception as notify_error:
+        logger.error(f"Failed to notify or remove channel for user {user_id}. Error: {notify_error}")
+    # Channel dobara add hone par fresh check hona chahiye
+    channel_registry.invalidate(channel_id)
+    return False
 
 def calculate_title_similarity(title1: str, title2: str) -> float:
     return fuzz.token_sort_ratio(title1, title2) / 100.0
@@ -0,0 +1,49 @@
+import logging
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+HTTP_POOL_LIMIT = 100
+HTTP_POOL_LIMIT_PER_HOST = 10
+DNS_CACHE_TTL = 5 * 60
+DEFAULT_TIMEOUT = aiohttp.ClientTimeout(total=15, connect=5)
+
+_session = None
+
+
+def _new_session():
+    connector = aiohttp.TCPConnector(
+        limit=HTTP_POOL_LIMIT, limit_per_host=HTTP_POOL_LIMIT_PER_HOST,
+        ttl_dns_cache=DNS_CACHE_TTL, enable_cleanup_closed=True
+    )
+    return aiohttp.ClientSession(connector=connector, timeout=DEFAULT_TIMEOUT)
+
+
+async def start_http_client():
+    """Creates the shared session. Called from Bot.start."""
+    global _session
+    if _session is None or _session.closed:
+        _session = _new_session()
+        logger.info("Shared HTTP client started.")
+    return _session
+
+
+def get_http_session() -> aiohttp.ClientSession:
+    """
+    The application-wide pooled session used for all outbound HTTP calls: keep-alive
+    connections per host, cached DNS and at most HTTP_POOL_LIMIT_PER_HOST requests to one
+    host at a time. Created on first use if Bot.start has not run (scripts, one-off tools).
+    Callers must not close it.
+    """
+    global _session
+    if _session is None or _session.closed:
+        _session = _new_session()
+    return _session
+
+
+async def close_http_client():
+    """Closes the shared session. Called from Bot.stop."""
+    global _session
+    if _session and not _session.closed:
+        await _session.close()
+    _session = None
@@ -0,0 +1,65 @@
+import logging
+from utils.cache import TTLCache
+from utils.rate_limiter import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+USER_RATE = 0.5            # sustained requests per second per user
+USER_BURST = 5
+DUPLICATE_WINDOW = 2       # a finished (user, payload) is still treated as a duplicate for this long
+LIMIT_NOTICE_WINDOW = USER_BURST / USER_RATE   # rate limited user ko is window mein ek hi baar batao
+BUCKET_IDLE_TTL = 10 * 60
+MAX_TRACKED_USERS = 20000
+RAN, DUPLICATE, RATE_LIMITED = "ran", "duplicate", "rate-limited"
+
+
+class RequestGuard:
+    """
+    Sheds repeated deep-link / button requests before they reach Mongo, FSub checks
+    or the shortener.
+
+    - A (user, payload) that is already running, or finished less than
+      DUPLICATE_WINDOW seconds ago, is dropped: the first request's reply already
+      goes to the same chat.
+    - Every user has a TokenBucket of USER_BURST requests refilling at USER_RATE
+      per second; requests beyond it are dropped. claim_limit_notice() lets the
+      caller tell a limited user once per LIMIT_NOTICE_WINDOW.
+    """
+
+    def __init__(self, rate=USER_RATE, burst=USER_BURST, duplicate_window=DUPLICATE_WINDOW):
+        self.rate = rate
+        self.burst = burst
+        self._buckets = TTLCache(maxsize=MAX_TRACKED_USERS, ttl=BUCKET_IDLE_TTL)
+        self._in_flight = set()
+        self._recent = TTLCache(maxsize=MAX_TRACKED_USERS, ttl=duplicate_window)
+        self._limit_notices = TTLCache(maxsize=MAX_TRACKED_USERS, ttl=LIMIT_NOTICE_WINDOW)
+
+    def _bucket(self, user_id):
+        bucket = self._buckets.get(user_id)
+        if bucket is None: bucket = TokenBucket(self.rate, capacity=self.burst)
+        self._buckets.set(user_id, bucket)
+        return bucket
+
+    def claim_limit_notice(self, user_id) -> bool:
+        """True the first time a user is rate limited within LIMIT_NOTICE_WINDOW, False after that."""
+        if user_id in self._limit_notices: return False
+        self._limit_notices.set(user_id, True)
+        return True
+
+    async def run(self, user_id, payload, handler):
+        """Awaits `handler()` unless the request is shed. Returns RAN, DUPLICATE or RATE_LIMITED."""
+        key = (user_id, payload)
+        if key in self._in_flight or key in self._recent: return DUPLICATE
+        if not self._bucket(user_id).try_acquire():
+            logger.debug(f"Rate limited user {user_id} (payload: {payload!r}).")
+            return RATE_LIMITED
+        self._in_flight.add(key)
+        try:
+            await handler()
+            return RAN
+        finally:
+            self._in_flight.discard(key)
+            self._recent.set(key, True)
+
+
+request_guard = RequestGuard()